@@ -0,0 +1,221 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+import instrumentation
+from causal_graph_structure import CausalModel
+from compiled_causal_model import CompiledCausalModel
+
+
+class CausalPartView:
+    '''
+    Lightweight stand-in for a CausalPart of an ArrayCausalModel: a (model, index) pair whose
+    attributes read and write the model's arrays. Views are created on access and compare equal
+    when they refer to the same part of the same model.
+    '''
+    __slots__ = ('model', 'index')
+
+    def __init__(self, model, index):
+        self.model = model
+        self.index = index
+
+    @property
+    def part_id(self):
+        return self.model.compiled.part_ids[self.index]
+
+    @property
+    def failure_prob(self):
+        return float(self.model.failure_prob[self.index])
+
+    @failure_prob.setter
+    def failure_prob(self, failure_prob):
+        self.model.failure_prob[self.index] = failure_prob
+
+    @property
+    def is_observable(self):
+        return bool(self.model.is_observable[self.index])
+
+    @is_observable.setter
+    def is_observable(self, is_observable):
+        self.model.is_observable[self.index] = is_observable
+
+    @property
+    def is_interactable(self):
+        return bool(self.model.is_interactable[self.index])
+
+    @is_interactable.setter
+    def is_interactable(self, is_interactable):
+        self.model.is_interactable[self.index] = is_interactable
+
+    @property
+    def causes(self):
+        compiled = self.model.compiled
+        return self.model.parts_from_indices(compiled.fwd_indices[compiled.fwd_indptr[self.index]:
+                                                                  compiled.fwd_indptr[self.index + 1]])
+
+    @property
+    def caused_by(self):
+        compiled = self.model.compiled
+        return self.model.parts_from_indices(compiled.rev_indices[compiled.rev_indptr[self.index]:
+                                                                  compiled.rev_indptr[self.index + 1]])
+
+    def __eq__(self, other):
+        return isinstance(other, CausalPartView) and other.model is self.model and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.model), self.index))
+
+    def __repr__(self):
+        return 'CausalPartView(' + repr(self.part_id) + ')'
+
+
+class PartViewList(Sequence):
+    '''read-only sequence of the parts of an ArrayCausalModel, views are created on access'''
+    def __init__(self, model):
+        self.model = model
+
+    def __len__(self):
+        return self.model.compiled.num_parts
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [CausalPartView(self.model, i) for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('part index out of range')
+        return CausalPartView(self.model, idx)
+
+    def __iter__(self):
+        return (CausalPartView(self.model, idx) for idx in range(len(self)))
+
+
+class ArrayCausalModel(CausalModel):
+    '''
+    Struct-of-arrays storage mode of CausalModel.
+
+    The graph is held as the CSR arrays of a CompiledCausalModel and the part attributes as flat
+    arrays (float64 failure_prob, bool is_observable / is_interactable), so a model costs a few
+    dozen bytes per part and edge instead of a CausalPart object with two neighbor lists each.
+    self.parts is a PartViewList of CausalPartView, so the CausalModel accessors and queries keep
+    working; the per-part accessors are replaced by array operations. The graph structure is fixed:
+    adding a part or a new edge raises TypeError, build a CausalModel and compile it instead. Closures walk the CSR arrays, so the parts come back in
+    the same depth-first pre-order but with neighbors visited in index order.
+    '''
+    def __init__(self, compiled=None):
+        super().__init__()
+        if compiled is not None:
+            self.init_from_compiled(compiled)
+        else:
+            self.init_from_compiled(CompiledCausalModel.from_edges([], [], []))
+
+    def init_from_compiled(self, compiled):
+        '''adopts the CSR arrays of compiled, the part attributes are copied so they can be modified'''
+        self.compiled = compiled
+        self.failure_prob = np.array(compiled.failure_prob, dtype=np.float64)
+        self.is_observable = np.array(compiled.is_observable, dtype=bool)
+        self.is_interactable = np.array(compiled.is_interactable, dtype=bool)
+        self.parts = PartViewList(self)
+        self.observable_parts = compiled.get_part_ids(compiled.observable_indices())
+        self.non_interactable_parts = compiled.get_part_ids(np.flatnonzero(~self.is_interactable))
+        self._reachability = None
+        self._structure_changed()
+
+    def parts_from_indices(self, indices):
+        return [CausalPartView(self, int(idx)) for idx in indices]
+
+    def get_part_from_id(self, part_id):
+        # returns the view of the part with part_id, False when there is none like CausalModel
+        idx = self.compiled.index_of.get(part_id)
+        if idx is None:
+            return False
+        return CausalPartView(self, idx)
+
+    def set_observable_parts(self, observable_parts_ids):
+        self.is_observable[self.compiled.get_indices(observable_parts_ids)] = True
+        self.observable_parts = observable_parts_ids
+        self._structure_changed()
+
+    def set_non_interactable_parts(self, interactable_parts_ids):
+        indices = self.compiled.get_indices(interactable_parts_ids)
+        self.is_interactable[indices] = False
+        self.failure_prob[indices] = 0
+        self.non_interactable_parts = interactable_parts_ids
+        if self._reachability is not None:
+            self._reachability.set_interactable(indices, False)
+        self._structure_changed()
+
+    def set_part_failure_rates(self, part_ids, part_failure_rates):
+        self.failure_prob[self.compiled.get_indices(part_ids)] = part_failure_rates
+
+    def get_part_failure_rates(self, part_ids):
+        return self.failure_prob[self.compiled.get_indices(part_ids)].tolist()
+
+    def get_interactable_part_ids(self):
+        if self._interactable_ids is None:
+            self._interactable_ids = tuple(self.compiled.get_part_ids(np.flatnonzero(self.is_interactable)))
+        return list(self._interactable_ids)
+
+    def get_interactable_mask(self):
+        mask = self.is_interactable.view()
+        mask.flags.writeable = False
+        return mask
+
+    def get_failure_rate_array(self, mask=None):
+        return self.failure_prob.copy() if mask is None else self.failure_prob[mask]
+
+    def set_failure_rate_array(self, failure_rates, mask=None):
+        if mask is None:
+            self.failure_prob[:] = failure_rates
+        else:
+            self.failure_prob[mask] = failure_rates
+
+    def add_new_part_empty(self, part):
+        raise TypeError('ArrayCausalModel is read-only, parts can not be added; build a CausalModel instead')
+
+    def _add_edge(self, part, cause_part):
+        compiled = self.compiled
+        causes = compiled.fwd_indices[compiled.fwd_indptr[part.index]:compiled.fwd_indptr[part.index + 1]]
+        if cause_part.index not in causes:
+            raise TypeError('ArrayCausalModel is read-only, edges can not be added; build a CausalModel instead')
+
+    def _collect_closure(self, part_id, current_list, neighbor_attr):
+        # the same iterative pre-order walk as CausalModel._collect_closure over the CSR arrays
+        if neighbor_attr == 'caused_by':
+            indptr, indices = self.compiled.rev_indptr, self.compiled.rev_indices
+        else:
+            indptr, indices = self.compiled.fwd_indptr, self.compiled.fwd_indices
+        # memoryviews index and slice without creating numpy scalars for every part
+        indptr = memoryview(np.ascontiguousarray(indptr))
+        indices = memoryview(np.ascontiguousarray(indices))
+        root_idx = self.compiled.get_index(part_id)
+        visited = bytearray(self.compiled.num_parts)
+        for part in current_list:
+            visited[part.index] = 1
+        order = [root_idx]
+        visited[root_idx] = 1
+
+        stack = [iter(indices[indptr[root_idx]:indptr[root_idx + 1]].tolist())]
+        while stack:
+            for next_idx in stack[-1]:
+                if not visited[next_idx]:
+                    visited[next_idx] = 1
+                    order.append(next_idx)
+                    stack.append(iter(indices[indptr[next_idx]:indptr[next_idx + 1]].tolist()))
+                    break
+            else:
+                stack.pop()
+        instrumentation.visit(len(order))
+        current_list.extend(self.parts_from_indices(order))
+        return current_list
+
+    def compile(self):
+        '''snapshot of the current part attributes over the shared CSR arrays, no per-part work'''
+        compiled = self.compiled
+        snapshot = CompiledCausalModel(compiled.part_ids, compiled.fwd_indptr, compiled.fwd_indices,
+                                       compiled.rev_indptr, compiled.rev_indices, self.failure_prob.copy(),
+                                       self.is_observable.copy(), self.is_interactable.copy(),
+                                       compiled.get_indices(self.observable_parts))
+        # same part ids, so the id -> index dict can be shared once it is built
+        snapshot._index_of = compiled._index_of
+        return snapshot
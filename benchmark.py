@@ -0,0 +1,288 @@
+'''
+Benchmark harness for causal models on synthetic circuit graphs.
+
+Generators build ladder, tree, mesh and random-cyclic circuits of a given size with a configurable
+fraction of observable and interactable parts. For every generator and size the harness times model
+construction, closures, root cause queries, planning and the expected value computations, and
+writes one JSON record per measurement so runs can be diffed to track regressions:
+
+  python benchmark.py --sizes 10 1000 100000 --output results.json
+
+Benchmarks whose cost grows quadratically with the model (the reachability index and everything
+built on it, the information gain planner, object models) are skipped above their --max-*-parts caps.
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from array_causal_model import ArrayCausalModel
+from causal_algorithms import CausalPlanner
+from causal_graph_structure import CausalModel
+from compiled_causal_model import CompiledCausalModel
+from diagnosis_service import DiagnosisService
+from expected_instructions import compute_expected_values, compute_expected_values_batch
+
+GENERATORS = ('ladder', 'tree', 'mesh', 'random_cyclic')
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+IMPORT_MODULES = ('causal_graph_structure', 'causal_algorithms', 'instruction_efficiency', 'expected_instructions',
+                  'experiment_runner', 'array_causal_model')
+
+
+def ladder_edges(num_parts, rng):
+    '''two rails of chained parts with a two way rung between the rails at every step'''
+    rungs = num_parts // 2
+    rail_a = np.arange(rungs)
+    rail_b = rail_a + rungs
+    sources = np.concatenate([rail_a[:-1], rail_b[:-1], rail_a, rail_b])
+    targets = np.concatenate([rail_a[1:], rail_b[1:], rail_b, rail_a])
+    return sources, targets
+
+
+def tree_edges(num_parts, rng, branching=3):
+    '''every part causes its children to fail, part 0 is the root'''
+    children = np.arange(1, num_parts)
+    return (children - 1) // branching, children
+
+
+def mesh_edges(num_parts, rng):
+    '''square grid where every part causes its right and lower neighbor to fail'''
+    side = int(np.ceil(np.sqrt(num_parts)))
+    parts = np.arange(num_parts)
+    right = parts[(parts % side < side - 1) & (parts + 1 < num_parts)]
+    down = parts[parts + side < num_parts]
+    return np.concatenate([right, down]), np.concatenate([right + 1, down + side])
+
+
+def random_cyclic_edges(num_parts, rng, degree=2):
+    '''degree * num_parts uniformly random edges, which form cycles of every length'''
+    sources = rng.integers(0, num_parts, degree * num_parts)
+    targets = rng.integers(0, num_parts, degree * num_parts)
+    keep = sources != targets
+    return sources[keep], targets[keep]
+
+
+EDGE_GENERATORS = {'ladder': ladder_edges, 'tree': tree_edges, 'mesh': mesh_edges, 'random_cyclic': random_cyclic_edges}
+
+
+def make_circuit(generator, num_parts, observable_fraction=0.1, interactable_fraction=0.8, seed=0):
+    '''
+    Returns a CompiledCausalModel of a synthetic circuit with parts labelled 0..num_parts-1.
+    Observable and interactable parts are drawn independently with the given fractions (at least one
+    of each), failure rates are random over the interactable parts and sum to one.
+    '''
+    rng = np.random.default_rng(seed)
+    sources, targets = EDGE_GENERATORS[generator](num_parts, rng)
+
+    is_observable = rng.random(num_parts) < observable_fraction
+    is_observable[rng.integers(num_parts)] = True
+    is_interactable = rng.random(num_parts) < interactable_fraction
+    is_interactable[rng.integers(num_parts)] = True
+    failure_prob = np.where(is_interactable, rng.random(num_parts), 0.0)
+    failure_prob /= failure_prob.sum()
+    return CompiledCausalModel.from_edges(list(range(num_parts)), sources, targets,
+                                          failure_prob, is_observable, is_interactable)
+
+
+def object_model_from_compiled(compiled):
+    '''builds a CausalModel the way user code does, one add_part_full call per part'''
+    causal_model = CausalModel()
+    fwd_indptr = compiled.fwd_indptr.tolist()
+    fwd_indices = compiled.fwd_indices.tolist()
+    for part_idx, part_id in enumerate(compiled.part_ids):
+        causal_model.add_part_full(part_id, [], [compiled.part_ids[idx] for idx in
+                                                 fwd_indices[fwd_indptr[part_idx]:fwd_indptr[part_idx + 1]]])
+    causal_model.set_observable_parts(compiled.get_part_ids(compiled.observable_indices()))
+    causal_model.set_non_interactable_parts(compiled.get_part_ids(np.flatnonzero(~compiled.is_interactable)))
+    causal_model.set_failure_rate_array(compiled.failure_prob)
+    return causal_model
+
+
+def time_calls(function, arguments, max_seconds):
+    '''
+    calls function once per argument tuple, stopping early once max_seconds have passed.
+    Returns (calls made, total seconds).
+    '''
+    calls = 0
+    total = 0.0
+    for argument in arguments:
+        start = time.perf_counter()
+        function(*argument)
+        total += time.perf_counter() - start
+        calls += 1
+        if total > max_seconds:
+            break
+    return calls, total
+
+
+def measure_import_times(modules=IMPORT_MODULES, repeat=3):
+    '''cold import time of every module in a fresh interpreter, best of repeat, in seconds'''
+    import_seconds = {}
+    for module in modules:
+        code = ('import time; start = time.perf_counter(); import ' + module +
+                '; print(time.perf_counter() - start)')
+        samples = []
+        for _ in range(repeat):
+            completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                       env=dict(os.environ, MPLBACKEND='Agg'),
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), timeout=600)
+            if completed.returncode != 0:
+                break
+            samples.append(float(completed.stdout.strip().splitlines()[-1]))
+        import_seconds[module] = min(samples) if samples else None
+    return import_seconds
+
+
+class BenchmarkRun:
+    '''collects the JSON records of one benchmark run'''
+    def __init__(self, args):
+        self.args = args
+        self.records = []
+
+    def record(self, generator, compiled, mode, benchmark, calls, total_seconds):
+        self.records.append({
+            'generator': generator,
+            'num_parts': compiled.num_parts,
+            'num_edges': compiled.num_edges,
+            'mode': mode,
+            'benchmark': benchmark,
+            'calls': calls,
+            'total_seconds': total_seconds,
+            'seconds_per_call': total_seconds / calls if calls else None,
+        })
+        print(generator, compiled.num_parts, mode, benchmark, calls, round(total_seconds, 6), file=sys.stderr)
+
+    def measure(self, generator, compiled, mode, benchmark, function, arguments=((),)):
+        calls, total_seconds = time_calls(function, arguments, self.args.max_seconds)
+        self.record(generator, compiled, mode, benchmark, calls, total_seconds)
+
+    def run_circuit(self, generator, num_parts):
+        args = self.args
+        rng = np.random.default_rng(args.seed)
+        start = time.perf_counter()
+        compiled = make_circuit(generator, num_parts, args.observable_fraction, args.interactable_fraction, args.seed)
+        self.record(generator, compiled, 'compiled', 'construct', 1, time.perf_counter() - start)
+
+        part_ids = rng.integers(0, num_parts, args.queries).tolist()
+        observable_ids = compiled.get_part_ids(compiled.observable_indices())
+        observations = [(rng.choice(observable_ids, min(2, len(observable_ids)), replace=False).tolist(),
+                         [observable_ids[rng.integers(len(observable_ids))]]) for _ in range(args.queries)]
+
+        models = {}
+        start = time.perf_counter()
+        models['array'] = ArrayCausalModel(compiled)
+        self.record(generator, compiled, 'array', 'construct', 1, time.perf_counter() - start)
+        if num_parts <= args.max_object_parts:
+            start = time.perf_counter()
+            models['object'] = object_model_from_compiled(compiled)
+            self.record(generator, compiled, 'object', 'construct', 1, time.perf_counter() - start)
+            self.measure(generator, compiled, 'object', 'compile', models['object'].compile)
+
+        for mode, causal_model in models.items():
+            # the query cache would turn repeated queries into lookups
+            causal_model.set_query_cache_size(0)
+            self.measure(generator, compiled, mode, 'find_all_causes_for_part', causal_model.find_all_causes_for_part,
+                         [(part_id, []) for part_id in part_ids])
+            self.measure(generator, compiled, mode, 'find_failures_caused_by_part',
+                         causal_model.find_failures_caused_by_part, [(part_id, []) for part_id in part_ids])
+            self.measure(generator, compiled, mode, 'find_potential_root_causes_from_observerables',
+                         causal_model.find_potential_root_causes_from_observerables, observations)
+
+        start = time.perf_counter()
+        planner = CausalPlanner(compiled, args.seed)
+        self.record(generator, compiled, 'compiled', 'planner_build', 1, time.perf_counter() - start)
+        self.measure(generator, compiled, 'compiled', 'plan', planner.plan, [(part_id,) for part_id in part_ids])
+
+        if num_parts > args.max_index_parts:
+            return
+        causal_model = models['array']
+        self.measure(generator, compiled, 'array', 'build_reachability_index', causal_model.build_reachability_index)
+        self.measure(generator, compiled, 'array', 'find_potential_root_causes_from_observerables_indexed',
+                     causal_model.find_potential_root_causes_from_observerables, observations)
+        reports = rng.integers(-1, 2, (args.batch_reports, len(observable_ids)))
+        self.measure(generator, compiled, 'array', 'find_potential_root_causes_batch',
+                     causal_model.find_potential_root_causes_batch, [(reports,)])
+        self.records[-1]['reports'] = args.batch_reports
+        self.measure(generator, compiled, 'array', 'get_fault_signature_table', causal_model.get_fault_signature_table)
+        self.run_diagnosis_batches(generator, compiled, rng)
+
+        num_interactable = int(compiled.is_interactable.sum())
+        distributions = rng.random((args.batch_distributions, num_interactable))
+        distributions /= distributions.sum(axis=1, keepdims=True)
+        self.measure(generator, compiled, 'array', 'compute_expected_values', compute_expected_values,
+                     [(causal_model, distribution) for distribution in distributions[:args.queries]])
+        self.measure(generator, compiled, 'array', 'compute_expected_values_batch', compute_expected_values_batch,
+                     [(causal_model, distributions)])
+        self.records[-1]['distributions'] = args.batch_distributions
+
+        if num_parts <= args.max_information_gain_parts:
+            self.measure(generator, compiled, 'array', 'information_gain_expected_instructions',
+                         lambda: causal_model.get_information_gain_planner().expected_instructions())
+
+    def run_diagnosis_batches(self, generator, compiled, rng):
+        '''one DiagnosisService batch with the per report word operations and with the dense matrix, for reports
+        observing three observables (partial) and every observable (full)'''
+        service = DiagnosisService(compiled)
+        observable_indices = compiled.observable_indices()
+        for observed, num_observed in (('partial', min(3, observable_indices.size)), ('full', observable_indices.size)):
+            reports = []
+            for _ in range(self.args.service_reports):
+                parts = rng.permutation(observable_indices)[:num_observed]
+                num_failing = int(rng.integers(1, num_observed + 1))
+                reports.append((np.sort(parts[num_failing:]), np.sort(parts[:num_failing]), 10))
+            for path, dense in (('packed', False), ('dense', True)):
+                self.measure(generator, compiled, 'service', 'diagnosis_batch_' + path + '_' + observed,
+                             service.evaluate_batch, [(reports, dense)] * 5)
+                self.records[-1]['reports'] = len(reports)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Times causal model operations on synthetic circuits, emits JSON.')
+    parser.add_argument('--generators', nargs='+', default=list(GENERATORS), choices=GENERATORS)
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument('--observable-fraction', type=float, default=0.1)
+    parser.add_argument('--interactable-fraction', type=float, default=0.8)
+    parser.add_argument('--queries', type=int, default=20, help='closure, root cause and plan queries per benchmark')
+    parser.add_argument('--batch-reports', type=int, default=1000)
+    parser.add_argument('--batch-distributions', type=int, default=100)
+    parser.add_argument('--service-reports', type=int, default=256, help='reports per diagnosis service batch')
+    parser.add_argument('--max-seconds', type=float, default=10.0,
+                        help='stop repeating a benchmark once its calls took this long')
+    parser.add_argument('--max-object-parts', type=int, default=100000)
+    parser.add_argument('--max-index-parts', type=int, default=20000)
+    parser.add_argument('--max-information-gain-parts', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-import-times', action='store_true')
+    parser.add_argument('--output', help='JSON file to write, stdout by default')
+    args = parser.parse_args(argv)
+
+    run = BenchmarkRun(args)
+    for generator in args.generators:
+        for num_parts in args.sizes:
+            run.run_circuit(generator, num_parts)
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'arguments': vars(args),
+            'import_seconds': None if args.no_import_times else measure_import_times(),
+        },
+        'results': run.records,
+    }
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == "__main__":
+    main()
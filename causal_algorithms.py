@@ -1,57 +1,74 @@
 import numpy as np
 import random
 from queue import Queue
-import networkx as nx
-import matplotlib.pyplot as plt
-
-#Matricies are in form [P1, P2, P3, L1, L2, L3, i1, i2, i3]
-circuit1_cm = np.zeros([9,9])
-circuit1_cm[0, 6] = 1 # R1 -> i1
-circuit1_cm[1, 7] = 1 # R2 -> i2
-circuit1_cm[2, 8] = 1 # R3 -> i3
-circuit1_cm[3, 6] = 1 # L1 -> i1
-circuit1_cm[6, 3] = 1 # i1 -> L1
-circuit1_cm[4, 7] = 1 # L2 -> i2
-circuit1_cm[7, 4] = 1 # i2 -> L2
-circuit1_cm[8, 6] = 1 # i3 -> i1
-circuit1_cm[8, 7] = 1 # i3 -> i2
-
-circuit2_cm = np.zeros([9,9])
-circuit2_cm[0, 6] = 1 # R1 -> i1
-circuit2_cm[1, 7] = 1 # R2 -> i2
-circuit2_cm[3, 6] = 1 # L1 -> i1
-circuit2_cm[6, 3] = 1 # i1 -> L1
-circuit2_cm[4, 7] = 1 # L2 -> i2
-circuit2_cm[5, 8] = 1 # L3 -> i2
-circuit2_cm[8, 5] = 1 # L3 -> i2
-circuit2_cm[7, 4] = 1 # i2 -> L2
-circuit2_cm[8, 6] = 1 # i3 -> i1
-circuit2_cm[8, 7] = 1 # i3 -> i2
-
-circuit3_cm = np.zeros([9,9])
-circuit3_cm[0, 6] = 1 # R1 -> i1
-circuit3_cm[1, 7] = 1 # R2 -> i2
-circuit3_cm[2, 8] = 1 # R3 -> i3
-circuit3_cm[3, 6] = 1 # L1 -> i1
-circuit3_cm[6, 3] = 1 # i1 -> L1
-circuit3_cm[4, 7] = 1 # L2 -> i2
-circuit3_cm[7, 4] = 1 # i2 -> L2
-circuit3_cm[8, 6] = 1 # i3 -> i1
-circuit3_cm[8, 7] = 1 # i3 -> i2
-
-circuit4_cm = np.zeros([9,9])
-circuit4_cm[0, 6] = 1 # R1 -> i1
-circuit4_cm[1, 7] = 1 # R2 -> i2
-circuit4_cm[2, 7] = 1 # R3 -> i2
-circuit4_cm[3, 6] = 1 # L1 -> i1
-circuit4_cm[6, 3] = 1 # i1 -> L1
-circuit4_cm[4, 7] = 1 # L2 -> i2
-circuit4_cm[5, 7] = 1 # L3 -> i2
-circuit4_cm[7, 5] = 1 # i2 -> L3
-circuit4_cm[7, 4] = 1 # i2 -> L2
-circuit4_cm[8, 6] = 1 # i3 -> i1
-circuit4_cm[8, 7] = 1 # i3 -> i2
-
+from compiled_causal_model import CompiledCausalModel, _csr_gather, _first_occurrences
+from condensation import CondensedCausalModel
+import instrumentation
+from instrumentation import instrumented
+
+CIRCUIT_MATRIX_NAMES = ('circuit1_cm', 'circuit2_cm', 'circuit3_cm', 'circuit4_cm')
+
+def build_circuit_matrices():
+    '''returns a dict of name -> 9x9 connectivity matrix of the example circuits'''
+    #Matricies are in form [P1, P2, P3, L1, L2, L3, i1, i2, i3]
+    circuit1_cm = np.zeros([9,9])
+    circuit1_cm[0, 6] = 1 # R1 -> i1
+    circuit1_cm[1, 7] = 1 # R2 -> i2
+    circuit1_cm[2, 8] = 1 # R3 -> i3
+    circuit1_cm[3, 6] = 1 # L1 -> i1
+    circuit1_cm[6, 3] = 1 # i1 -> L1
+    circuit1_cm[4, 7] = 1 # L2 -> i2
+    circuit1_cm[7, 4] = 1 # i2 -> L2
+    circuit1_cm[8, 6] = 1 # i3 -> i1
+    circuit1_cm[8, 7] = 1 # i3 -> i2
+
+    circuit2_cm = np.zeros([9,9])
+    circuit2_cm[0, 6] = 1 # R1 -> i1
+    circuit2_cm[1, 7] = 1 # R2 -> i2
+    circuit2_cm[3, 6] = 1 # L1 -> i1
+    circuit2_cm[6, 3] = 1 # i1 -> L1
+    circuit2_cm[4, 7] = 1 # L2 -> i2
+    circuit2_cm[5, 8] = 1 # L3 -> i2
+    circuit2_cm[8, 5] = 1 # L3 -> i2
+    circuit2_cm[7, 4] = 1 # i2 -> L2
+    circuit2_cm[8, 6] = 1 # i3 -> i1
+    circuit2_cm[8, 7] = 1 # i3 -> i2
+
+    circuit3_cm = np.zeros([9,9])
+    circuit3_cm[0, 6] = 1 # R1 -> i1
+    circuit3_cm[1, 7] = 1 # R2 -> i2
+    circuit3_cm[2, 8] = 1 # R3 -> i3
+    circuit3_cm[3, 6] = 1 # L1 -> i1
+    circuit3_cm[6, 3] = 1 # i1 -> L1
+    circuit3_cm[4, 7] = 1 # L2 -> i2
+    circuit3_cm[7, 4] = 1 # i2 -> L2
+    circuit3_cm[8, 6] = 1 # i3 -> i1
+    circuit3_cm[8, 7] = 1 # i3 -> i2
+
+    circuit4_cm = np.zeros([9,9])
+    circuit4_cm[0, 6] = 1 # R1 -> i1
+    circuit4_cm[1, 7] = 1 # R2 -> i2
+    circuit4_cm[2, 7] = 1 # R3 -> i2
+    circuit4_cm[3, 6] = 1 # L1 -> i1
+    circuit4_cm[6, 3] = 1 # i1 -> L1
+    circuit4_cm[4, 7] = 1 # L2 -> i2
+    circuit4_cm[5, 7] = 1 # L3 -> i2
+    circuit4_cm[7, 5] = 1 # i2 -> L3
+    circuit4_cm[7, 4] = 1 # i2 -> L2
+    circuit4_cm[8, 6] = 1 # i3 -> i1
+    circuit4_cm[8, 7] = 1 # i3 -> i2
+
+    return {'circuit1_cm': circuit1_cm, 'circuit2_cm': circuit2_cm, 'circuit3_cm': circuit3_cm,
+            'circuit4_cm': circuit4_cm}
+
+def __getattr__(name):
+    # the example circuits are built on first access (causal_algorithms.circuit1_cm), not on import
+    if name in CIRCUIT_MATRIX_NAMES:
+        globals().update(build_circuit_matrices())
+        return globals()[name]
+    raise AttributeError('module ' + repr(__name__) + ' has no attribute ' + repr(name))
+
+@instrumented()
 def generate_plan_causal_from_single_part(causal_model, broken_part):
     '''
     This function generates a plan to find a broken part using a breadth-first search through a causal model graph
@@ -84,37 +101,143 @@ def generate_plan_causal_from_single_part(causal_model, broken_part):
             connected_parts = np.delete(connected_parts, np.where(connected_parts == current_part)[0])
             parts_to_check.put(current_part)
 
+    instrumentation.visit(len(plan_of_attack))
     return plan_of_attack
 
+@instrumented()
 def generate_plan_causal_from_multiple_parts(causal_model, broken_parts):
     origin_part_path = generate_plan_causal_from_single_part(causal_model, broken_parts[0])
     part_path = origin_part_path
     for broken_part in broken_parts[1:]:
-        new_part_path = generate_plan_causal_from_single_part(causal_model, broken_part)
-        for part in part_path.copy():
-            if part not in new_part_path:
-                part_path.remove(part)
+        new_part_path = set(generate_plan_causal_from_single_part(causal_model, broken_part))
+        part_path = [part for part in part_path if part in new_part_path]
 
     return part_path
         
+@instrumented()
+def generate_plan_causal_condensed(causal_model, broken_part, rng=None):
+    '''
+    Breadth-first plan over the strongly connected component condensation of the graph, so loops such
+    as L1 <-> i1 are walked once as a super-node. The plan lists the broken part, then the rest of its
+    component, then the components which can cause it to fail level by level, the members of each
+    component back to back. The order differs from generate_plan_causal_from_single_part: the whole
+    component of the broken part comes first, so a part one hop away in another component is checked
+    after parts several hops away inside the broken part's component. Both plans contain the same parts.
+    Inputs:
+      causal_model - NxN directional connectivity matrix
+      broken_part [int] - index of broken part
+      rng - optional numpy Generator used to randomize the order within components and BFS levels
+
+    Outputs:
+      plan - M sized list of an order of parts to check, each part appears once.
+    '''
+    condensed = CondensedCausalModel(CompiledCausalModel.from_matrix(causal_model))
+    return condensed.plan(broken_part, rng).tolist()
+
+class CausalPlanner:
+    '''
+    Reusable breadth-first planner with the semantics of generate_plan_causal_from_single_part.
+
+    The connectivity (NxN dense array, scipy.sparse matrix, (sources, targets) COO tuple or a
+    CompiledCausalModel) is converted once into reverse CSR adjacency. The neighbor order of every part is
+    shuffled up front with a seedable numpy Generator instead of the global random module, so plans are
+    reproducible for a given seed. Each plan is a level synchronous BFS with a visited bitmap, producing
+    exactly the order a deque based BFS over the shuffled neighbor lists would. Unlike the original, a
+    part is marked visited when it is queued, so it appears in the plan once.
+    '''
+    def __init__(self, causal_model, seed=None):
+        if isinstance(causal_model, CompiledCausalModel):
+            self.compiled = causal_model
+        else:
+            self.compiled = CompiledCausalModel.from_matrix(causal_model)
+        self.num_parts = self.compiled.num_parts
+        self.rng = np.random.default_rng(seed)
+        self.reshuffle()
+
+    def reshuffle(self):
+        '''draws a new random neighbor order for every part from the planner's generator'''
+        indptr = self.compiled.rev_indptr
+        row_of_entry = np.repeat(np.arange(self.num_parts), np.diff(indptr))
+        # random keys in [0, 1) keep every row's entries together while shuffling them
+        order = np.argsort(row_of_entry + self.rng.random(row_of_entry.size), kind='stable')
+        self.indptr = indptr
+        self.neighbors = self.compiled.rev_indices[order]
+
+    @instrumented()
+    def plan(self, broken_part):
+        '''returns the array of part indices to check, starting with broken_part'''
+        visited = np.zeros(self.num_parts, dtype=bool)
+        frontier = np.array([broken_part], dtype=np.int64)
+        visited[frontier] = True
+        levels = [frontier]
+        while frontier.size:
+            candidates = _csr_gather(self.indptr, self.neighbors, frontier)
+            frontier = _first_occurrences(candidates[~visited[candidates]]).astype(np.int64)
+            visited[frontier] = True
+            levels.append(frontier)
+        plan = np.concatenate(levels)
+        instrumentation.visit(plan.size)
+        return plan
+
+    def reachable(self, broken_part):
+        '''bitmap of the parts which can cause broken_part to fail (its plan, unordered)'''
+        reached = np.zeros(self.num_parts, dtype=bool)
+        reached[self.compiled.ancestors(broken_part)] = True
+        return reached
+
+    @instrumented()
+    def plan_multiple(self, broken_parts):
+        '''
+        Plan for several simultaneously broken parts, with the semantics of generate_plan_causal_from_multiple_parts:
+        the plan of broken_parts[0] restricted to parts which can cause every other broken part to fail.
+        The reachability bitmaps of the other parts are intersected and the first plan is filtered in one pass.
+        '''
+        plan = self.plan(broken_parts[0])
+        common = np.ones(self.num_parts, dtype=bool)
+        for broken_part in broken_parts[1:]:
+            common &= self.reachable(broken_part)
+        return plan[common[plan]]
+
+def generate_plan_causal_fast(causal_model, broken_part, seed=None):
+    '''
+    generate_plan_causal_from_single_part on the CausalPlanner backend, reproducible through seed.
+    Build a CausalPlanner directly to reuse it across many plans on the same matrix.
+    '''
+    return CausalPlanner(causal_model, seed).plan(broken_part).tolist()
+
+def generate_plan_causal_fast_from_multiple_parts(causal_model, broken_parts, seed=None):
+    '''generate_plan_causal_from_multiple_parts on the CausalPlanner backend, reproducible through seed'''
+    return CausalPlanner(causal_model, seed).plan_multiple(broken_parts).tolist()
+
 def generate_observables_from_failure(causal_model, broken_part):
     observed_parts_broken = []
 
     
     return observed_parts_broken
     
-dual_plan = generate_plan_causal_from_multiple_parts(circuit4_cm, [3,4])
-graph = nx.from_numpy_array(circuit4_cm, create_using=nx.DiGraph)
-
-options = {
-    'node_color': 'blue',
-    'node_size': 500,
-    'width': 3,
-    'arrowstyle': '-|>',
-    'arrowsize': 12,
-}
-nx.draw_networkx(graph, arrows=True, **options)
-plt.show()
-
-print(generate_plan_causal_from_single_part(circuit1_cm, 3))
-print(generate_plan_causal_from_single_part(circuit2_cm, 8))
+def plot_causal_graph(causal_model):
+    '''draws a connectivity matrix with networkx and shows it, matplotlib and networkx are imported here'''
+    import matplotlib.pyplot as plt
+    import networkx as nx
+
+    graph = nx.from_numpy_array(causal_model, create_using=nx.DiGraph)
+    options = {
+        'node_color': 'blue',
+        'node_size': 500,
+        'width': 3,
+        'arrowstyle': '-|>',
+        'arrowsize': 12,
+    }
+    nx.draw_networkx(graph, arrows=True, **options)
+    plt.show()
+
+def main():
+    circuits = build_circuit_matrices()
+    dual_plan = generate_plan_causal_from_multiple_parts(circuits['circuit4_cm'], [3,4])
+    plot_causal_graph(circuits['circuit4_cm'])
+
+    print(generate_plan_causal_from_single_part(circuits['circuit1_cm'], 3))
+    print(generate_plan_causal_from_single_part(circuits['circuit2_cm'], 8))
+
+if __name__ == "__main__":
+    main()
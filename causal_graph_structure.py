@@ -1,44 +1,93 @@
-import numpy as np
+# numpy and the array backed modules are imported by the methods which use them, so workers which only
+# build models and run graph queries start without loading numpy
+import instrumentation
+from instrumentation import instrumented
+from query_cache import DEFAULT_MAX_ELEMENTS, QueryCache
 
 class CausalPart:
+    # no per instance __dict__, parts are the bulk of a model's memory
+    __slots__ = ('part_id', '_caused_by', '_causes', 'failure_prob', 'is_observable', 'is_interactable')
+
     def __init__(self, part_id):
         self.part_id = part_id #string 
-        self.caused_by = [] #list of CausalPart types
-        self.causes = [] #list of CausalPart type
+        # insertion ordered dicts (CausalPart -> None) keep the neighbors in the order they were
+        # added and give O(1) membership checks without a second copy of every edge
+        self._caused_by = {} #CausalPart types
+        self._causes = {} #CausalPart types
         self.failure_prob = float("nan")
         self.is_observable = False
         self.is_interactable = True
 
+    @property
+    def caused_by(self):
+        # read only view in insertion order, use add_caused_by to link parts
+        return self._caused_by.keys()
+
+    @property
+    def causes(self):
+        # read only view in insertion order, use add_cause to link parts
+        return self._causes.keys()
+
     def add_caused_by(self, caused_by):
         #adds new CausalPart as a cause of part if that part is not already there
-        for part in self.caused_by:
-            if part == caused_by:
-                return
-        self.caused_by.append(caused_by)
+        self._caused_by.setdefault(caused_by)
 
     def add_cause(self, cause):
-         #adds new CausalPart for things the part causes if that part is not already there
-        for part in self.causes:
-            if part == cause:
-                return
-        self.causes.append(cause)
+        #adds new CausalPart for things the part causes if that part is not already there
+        self._causes.setdefault(cause)
+
+    def set_neighbors(self, caused_by, causes):
+        #replaces both neighbor lists, duplicates are dropped keeping the first occurrence
+        self._caused_by = dict.fromkeys(caused_by)
+        self._causes = dict.fromkeys(causes)
 
 class CausalModel:
     def __init__(self):
         self.parts = []
+        self._parts_by_id = {} # part id -> CausalPart, kept in sync with self.parts
         self.observable_parts = []
         self.non_interactable_parts = []
+        self._reachability = None # optional ReachabilityIndex, see build_reachability_index
+        self._signatures = None # FaultSignatureTable, see get_fault_signature_table
+        # bumped on every structural change (parts, edges, observable or interactable parts) but not on
+        # failure rate changes; cached query results from an older version are discarded
+        self._structure_version = 0
+        self._query_cache = QueryCache()
+        # interactable part ids and mask, cached until the next structural change
+        self._interactable_ids = None
+        self._interactable_mask = None
+
+    def _structure_changed(self):
+        self._structure_version += 1
+        self._signatures = None
+        self._interactable_ids = None
+        self._interactable_mask = None
+
+    def set_query_cache_size(self, maxsize, max_elements=DEFAULT_MAX_ELEMENTS):
+        '''
+        bounds the number of memoized closure, signature and root cause queries, 0 disables the cache;
+        max_elements bounds the total number of parts and part ids the cached results hold
+        '''
+        self._query_cache = QueryCache(maxsize, max_elements)
+
+    def query_cache_info(self):
+        '''hits, misses, size, maxsize, elements, max_elements and version of the query cache'''
+        return self._query_cache.info()
 
     def set_observable_parts(self, observable_parts_ids):
         self.observable_parts = observable_parts_ids
         for part_id in observable_parts_ids:
             self.get_part_from_id(part_id).is_observable = True
+        self._structure_changed()
             
     def set_non_interactable_parts(self, interactable_parts_ids):
         self.non_interactable_parts = interactable_parts_ids
         for part_id in interactable_parts_ids:
             self.get_part_from_id(part_id).is_interactable = False
             self.get_part_from_id(part_id).failure_prob = 0
+        if self._reachability is not None:
+            self._reachability.set_interactable(self._reachability.compiled.get_indices(interactable_parts_ids), False)
+        self._structure_changed()
     
     def set_part_failure_rates(self, part_ids, part_failure_rates):
         for part_idx, part_id in enumerate(part_ids):
@@ -46,15 +95,12 @@ class CausalModel:
 
     def get_part_from_id(self, part_id):
         # returns CausalPart part in part list from part id
-        for part in self.parts:
-            if part.part_id == part_id:
-                return part
-        return False
+        return self._parts_by_id.get(part_id, False)
     
     def get_parts_from_ids(self, part_ids):
         parts = []
         for part_id in part_ids:
-            part_ids.append(self.get_part_from_id(part_id))
+            parts.append(self.get_part_from_id(part_id))
         return parts
     
     def get_part_ids_from_parts(self, parts):
@@ -70,11 +116,36 @@ class CausalModel:
         return frequencies
 
     def get_interactable_part_ids(self):
-        interactable_parts = []
-        for part in self.parts:
-            if part.is_interactable:
-                interactable_parts.append(part.part_id)
-        return interactable_parts
+        if self._interactable_ids is None:
+            self._interactable_ids = tuple(part.part_id for part in self.parts if part.is_interactable)
+        return list(self._interactable_ids)
+
+    def get_interactable_mask(self):
+        '''read-only bool array over self.parts, True for interactable parts, cached until the next structural change'''
+        if self._interactable_mask is None:
+            import numpy as np
+            self._interactable_mask = np.array([part.is_interactable for part in self.parts], dtype=bool)
+            self._interactable_mask.flags.writeable = False
+        return self._interactable_mask
+
+    def get_failure_rate_array(self, mask=None):
+        '''failure_prob of every part as a float64 array in self.parts order, or of the parts selected by a bool mask'''
+        import numpy as np
+
+        failure_prob = np.fromiter((part.failure_prob for part in self.parts), dtype=np.float64, count=len(self.parts))
+        return failure_prob if mask is None else failure_prob[mask]
+
+    def set_failure_rate_array(self, failure_rates, mask=None):
+        '''
+        sets failure_prob of every part from an array in self.parts order, or of the parts selected by a
+        bool mask (e.g. get_interactable_mask()); a scalar sets them all to the same rate
+        '''
+        import numpy as np
+
+        parts = self.parts if mask is None else [self.parts[idx] for idx in np.flatnonzero(mask)]
+        failure_rates = np.broadcast_to(np.asarray(failure_rates, dtype=np.float64), (len(parts),))
+        for part, failure_rate in zip(parts, failure_rates.tolist()):
+            part.failure_prob = failure_rate
     
     def add_part_full(self, part_id, caused_by_ids, causes_ids):
         if not self.get_part_from_id(part_id):
@@ -85,6 +156,10 @@ class CausalModel:
 
     def add_new_part_empty(self, part):
         self.parts.append(part)
+        self._parts_by_id[part.part_id] = part
+        # a new part changes the width of every bitset row, so the index has to be rebuilt
+        self._reachability = None
+        self._structure_changed()
 
     def add_part_causes(self, part, cause_ids):
         for cause_id in cause_ids:
@@ -92,8 +167,7 @@ class CausalModel:
             if not self.get_part_from_id(cause_id):
                 self.add_new_part_empty(CausalPart(cause_id))
             cause_part = self.get_part_from_id(cause_id)
-            part.add_cause(cause_part)
-            cause_part.add_caused_by(part)
+            self._add_edge(part, cause_part)
 
     def add_part_caused_bys(self, part, caused_by_ids):
         for cause_by_id in caused_by_ids:
@@ -101,28 +175,43 @@ class CausalModel:
             if not self.get_part_from_id(cause_by_id):
                 self.add_new_part_empty(CausalPart(cause_by_id))
             caused_by_part = self.get_part_from_id(cause_by_id)
-            part.add_caused_by(caused_by_part)
-            caused_by_part.add_cause(part)
-
+            self._add_edge(caused_by_part, part)
+
+    def _add_edge(self, part, cause_part):
+        # links part -> cause_part (part causes cause_part to fail) and patches the reachability index
+        if cause_part not in part.causes:
+            self._structure_changed()
+            if self._reachability is not None:
+                index_of = self._reachability.compiled.index_of
+                self._reachability.add_edge(index_of[part.part_id], index_of[cause_part.part_id])
+        part.add_cause(cause_part)
+        cause_part.add_caused_by(part)
+
+    @instrumented()
     def find_all_causes_for_part(self, part_id, current_cause_list):
-        # Recursive function which finds all the parts which can cause the target part to fail
+        # Finds all the parts which can cause the target part to fail
         # returns list of part objects which can cause the target part to fail
 
         # Initilize current_cause_list to [] for root iteration
-        root_part = self.get_part_from_id(part_id)
-        current_cause_list.append(root_part)
-
-        for caused_by in root_part.caused_by:
-            part_is_excluded = False
-            #check if part is already in the cause list, and run function on new cause part
-            for excluded_part in current_cause_list:
-                if caused_by == excluded_part:
-                    part_is_excluded = True
-            if not part_is_excluded:
-                current_cause_list = self.find_all_causes_for_part(caused_by.part_id, current_cause_list)
-        return current_cause_list
+        return self._cached_closure(part_id, current_cause_list, 'caused_by')
 
+    @instrumented()
     def find_potential_root_causes_from_observerables(self, part_ids_working, part_ids_not_working):
+        # arguments may be iterators, they are read once for both the key and the query
+        part_ids_working = tuple(part_ids_working)
+        part_ids_not_working = tuple(part_ids_not_working)
+        key = ('root_causes', part_ids_working, part_ids_not_working)
+        return list(self._query_cache.get(
+            self._structure_version, key,
+            lambda: tuple(self._find_potential_root_causes(part_ids_working, part_ids_not_working)),
+            lambda root_causes: len(root_causes) + len(part_ids_working) + len(part_ids_not_working)))
+
+    def _find_potential_root_causes(self, part_ids_working, part_ids_not_working):
+        if self._reachability is not None:
+            index = self._reachability
+            candidates = index.root_cause_candidates(index.compiled.get_indices(part_ids_working),
+                                                     index.compiled.get_indices(part_ids_not_working))
+            return index.compiled.get_part_ids(candidates)
 
         # Initalize possible causes to all parts
         potential_causes_ids = []
@@ -157,31 +246,89 @@ class CausalModel:
 
         return potential_causes_ids_interactable
 
+    @instrumented()
+    def find_potential_root_causes_batch(self, observations, observable_ids=None):
+        '''
+        Evaluates many fault reports at once.
+        Inputs:
+          observations - R x O matrix, one row per report, with OBSERVATION_FAILING (1), OBSERVATION_WORKING (0)
+                         or OBSERVATION_UNKNOWN (-1) for each observable
+          observable_ids - O part ids labelling the columns, defaults to self.observable_parts
+
+        Outputs:
+          candidates - R x N bool matrix, columns follow self.parts; row r matches
+                       find_potential_root_causes_from_observerables for report r
+        '''
+        if observable_ids is None:
+            observable_ids = self.observable_parts
+        index = self._reachability if self._reachability is not None else self.build_reachability_index()
+        return index.root_cause_candidate_matrix(index.compiled.get_indices(observable_ids), observations)
+
+    @instrumented()
     def find_failures_caused_by_part(self, part_id, current_caused_by_list):
-        # Recursive function which finds all the parts which the target part will cause to fail
-        # returns list of part objects which can cause the target part to fail
-
-        # Initilize current_cause_list to [] for root iteration
+        # Finds all the parts which the target part will cause to fail
+        # returns list of part objects which the target part will cause to fail
+
+        # Initilize current_caused_by_list to [] for root iteration
+        return self._cached_closure(part_id, current_caused_by_list, 'causes')
+
+    def _cached_closure(self, part_id, current_list, neighbor_attr):
+        # closures started from an empty list are memoized, the caller's list still receives the parts
+        if current_list:
+            return self._collect_closure(part_id, current_list, neighbor_attr)
+        closure = self._query_cache.get(self._structure_version, (neighbor_attr, part_id),
+                                        lambda: tuple(self._collect_closure(part_id, [], neighbor_attr)))
+        current_list.extend(closure)
+        return current_list
+
+    def _collect_closure(self, part_id, current_list, neighbor_attr):
+        # Iterative depth-first walk along neighbor_attr ('caused_by' or 'causes') which appends
+        # parts to current_list in the same pre-order as a recursive walk would, without hitting
+        # the recursion limit on deep graphs. Parts already in current_list are not revisited.
         root_part = self.get_part_from_id(part_id)
-        current_caused_by_list.append(root_part)
-
-        for cause in root_part.causes:
-            part_is_excluded = False
-            #check if part is already in the cause list, and run function on new cause part
-            for excluded_part in current_caused_by_list:
-                if cause == excluded_part:
-                    part_is_excluded = True
-            if not part_is_excluded:
-                current_caused_by_list = self.find_failures_caused_by_part(cause.part_id, current_caused_by_list)
-        return current_caused_by_list
+        num_listed = len(current_list)
+        visited = set(current_list)
+        current_list.append(root_part)
+        visited.add(root_part)
+
+        stack = [iter(getattr(root_part, neighbor_attr))]
+        while stack:
+            for next_part in stack[-1]:
+                if next_part not in visited:
+                    visited.add(next_part)
+                    current_list.append(next_part)
+                    stack.append(iter(getattr(next_part, neighbor_attr)))
+                    break
+            else:
+                stack.pop()
+        instrumentation.visit(len(current_list) - num_listed)
+        return current_list
     
+    @instrumented()
     def find_observables_from_failure(self, part_id):
         '''returns list of working and not working observables'''
+        working_observables, not_working_observables = self._query_cache.get(
+            self._structure_version, ('observables', part_id),
+            lambda: tuple(tuple(observables) for observables in self._find_observables_from_failure(part_id)),
+            lambda observables: len(observables[0]) + len(observables[1]))
+        return list(working_observables), list(not_working_observables)
+
+    def _find_observables_from_failure(self, part_id):
         working_observables = []
         not_working_observables = []
 
         assert self.observable_parts
 
+        if self._signatures is not None:
+            part_idx = self._signatures.compiled.get_index(part_id)
+            failing_obs_idxs = set(self._signatures.failing_observables(part_idx).tolist())
+            for obs_idx, obs_part_id in enumerate(self.observable_parts):
+                if obs_idx in failing_obs_idxs:
+                    not_working_observables.append(obs_part_id)
+                else:
+                    working_observables.append(obs_part_id)
+            return working_observables, not_working_observables
+
         other_parts_failing = self.find_failures_caused_by_part(part_id, [])
         for obs_part_id in self.observable_parts:
             observable_failing = False
@@ -195,13 +342,119 @@ class CausalModel:
 
         return working_observables, not_working_observables
 
-    def init_from_matrix(self, matrix):
-        '''TODO: add function which turns a graph in matrix form into CausalModel stucture'''
-        # assert self.parts.empty()
-        
-        # for ridx in range(matrix.shape[0]):
-        #     part = CausalPart(ridx)
-        #     for cidx in range(matrix.shape[1]):
+    def compile(self):
+        '''
+        returns a CompiledCausalModel: an integer indexed snapshot of the model with CSR
+        forward/reverse adjacency arrays and iterative BFS closures (ancestors/descendants)
+        '''
+        from compiled_causal_model import CompiledCausalModel
+        return CompiledCausalModel.from_causal_model(self)
+
+    def condense(self):
+        '''
+        returns a CondensedCausalModel: the strongly connected components of the model collapsed
+        into super-nodes with a DAG between them, for closure, observable signature and planning queries
+        '''
+        from condensation import CondensedCausalModel
+        return CondensedCausalModel(self.compile())
+
+    def build_reachability_index(self):
+        '''
+        Builds a ReachabilityIndex (packed ancestor/descendant bitset rows per part) which
+        find_potential_root_causes_from_observerables then uses instead of walking the graph.
+        The index is patched in place when add_part_full adds edges between existing parts and
+        dropped when a new part is added.
+        '''
+        from reachability import ReachabilityIndex
+        self._reachability = ReachabilityIndex(self.compile())
+        return self._reachability
+
+    def get_fault_signature_table(self):
+        '''
+        Returns the FaultSignatureTable of the model (which observables each part breaks and the parts
+        behind each observable pattern), building it and the reachability index when needed.
+        Once built, find_observables_from_failure reads from the table. It is dropped whenever the
+        graph, the observable parts or the interactable parts change.
+        '''
+        if self._signatures is None:
+            from fault_signatures import FaultSignatureTable
+            index = self._reachability if self._reachability is not None else self.build_reachability_index()
+            self._signatures = FaultSignatureTable(index, index.compiled.get_indices(self.observable_parts))
+        return self._signatures
+
+    def get_information_gain_planner(self, observation_cost=1.0):
+        '''
+        Returns an InformationGainPlanner over the current graph and failure rates, which picks the
+        observable or part to check next by expected entropy reduction and evaluates E[M_ig].
+        Reading an observable costs observation_cost instructions, checking a part costs one.
+        '''
+        from information_gain import InformationGainPlanner
+        return InformationGainPlanner(self, observation_cost)
+
+    def start_diagnosis_session(self):
+        '''
+        Returns a DiagnosisSession which narrows the root cause candidates one observation at a time,
+        with undo, instead of re-evaluating find_potential_root_causes_from_observerables on every change.
+        '''
+        from diagnosis_session import DiagnosisSession
+        return DiagnosisSession(self)
+
+    def save(self, path):
+        '''writes the model (graph, flags and failure rates) to path in the binary format of model_file'''
+        from model_file import save_compiled_model
+        save_compiled_model(self.compile(), path)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        reads a model written by save. Use model_file.load_compiled_model directly to get the
+        memory-mapped CompiledCausalModel without building CausalPart objects.
+        '''
+        from model_file import load_compiled_model
+        causal_model = cls()
+        causal_model.init_from_compiled(load_compiled_model(path))
+        return causal_model
+
+    def init_from_matrix(self, matrix, part_ids=None):
+        '''
+        Fills an empty model from a connectivity matrix where matrix[i, j] != 0 means part i causes part j to fail
+        (the format of the circuit matrices in causal_algorithms).
+        Inputs:
+          matrix - NxN dense array, scipy.sparse matrix, or a (sources, targets) tuple of COO edge index arrays
+          part_ids - optional N unique part ids labelling the rows/columns, parts are labelled 0..N-1 otherwise
+        Raises ValueError for malformed input, see CompiledCausalModel.from_matrix.
+        '''
+        from compiled_causal_model import CompiledCausalModel
+        self.init_from_compiled(CompiledCausalModel.from_matrix(matrix, part_ids))
+
+    def init_from_compiled(self, compiled):
+        '''
+        Fills an empty model from a CompiledCausalModel in a single pass over its CSR arrays,
+        including failure rates and observable/interactable flags
+        '''
+        assert not self.parts
+
+        parts = [CausalPart(part_id) for part_id in compiled.part_ids]
+        fwd_indptr = compiled.fwd_indptr.tolist()
+        fwd_indices = compiled.fwd_indices.tolist()
+        rev_indptr = compiled.rev_indptr.tolist()
+        rev_indices = compiled.rev_indices.tolist()
+        failure_prob = compiled.failure_prob.tolist()
+        is_observable = compiled.is_observable.tolist()
+        is_interactable = compiled.is_interactable.tolist()
+        for part_idx, part in enumerate(parts):
+            part.set_neighbors([parts[idx] for idx in rev_indices[rev_indptr[part_idx]:rev_indptr[part_idx + 1]]],
+                               [parts[idx] for idx in fwd_indices[fwd_indptr[part_idx]:fwd_indptr[part_idx + 1]]])
+            part.failure_prob = failure_prob[part_idx]
+            part.is_observable = is_observable[part_idx]
+            part.is_interactable = is_interactable[part_idx]
+
+        self.parts = parts
+        self._parts_by_id = dict(zip(compiled.part_ids, parts))
+        self.observable_parts = compiled.get_part_ids(compiled.observable_indices())
+        self.non_interactable_parts = [part.part_id for part in parts if not part.is_interactable]
+        self._reachability = None
+        self._structure_changed()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,255 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+import instrumentation
+
+
+def _sorted_unique(values):
+    '''sorted unique values of an integer array, a plain sort is much faster than np.unique on large inputs'''
+    values = np.sort(values)
+    if values.size:
+        keep = np.empty(values.size, dtype=bool)
+        keep[0] = True
+        np.not_equal(values[1:], values[:-1], out=keep[1:])
+        values = values[keep]
+    return values
+
+
+def _first_occurrences(values):
+    '''unique values of an integer array in the order they first appear'''
+    if values.size == 0:
+        return values
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    keep = np.empty(values.size, dtype=bool)
+    keep[0] = True
+    np.not_equal(sorted_values[1:], sorted_values[:-1], out=keep[1:])
+    return values[np.sort(order[keep])]
+
+
+def _csr_from_edges(num_parts, sources, targets):
+    '''
+    Builds CSR arrays (indptr, indices) for the edges sources[k] -> targets[k].
+    Neighbors of each part keep the order of the edge list, so they are in ascending index order
+    when the edges are sorted by (target, source) or by (source, target).
+    '''
+    order = np.argsort(sources, kind='stable')
+    indices = targets[order].astype(np.int32)
+    counts = np.bincount(sources, minlength=num_parts)
+    indptr = np.zeros(num_parts + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, indices
+
+
+def _csr_gather(indptr, indices, rows):
+    '''returns the concatenated neighbor lists of every index in rows'''
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=indices.dtype)
+    # position of each gathered element inside indices, built without a python loop
+    row_offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return indices[row_offsets + np.arange(total)]
+
+
+def _csr_closure(indptr, indices, start_indices, num_parts):
+    '''
+    Level synchronous BFS over a CSR graph using a visited bitmap.
+    Every edge is touched at most once so the closure is O(N + E).
+    Returns the reached indices (including the start indices) in BFS level order.
+    '''
+    visited = np.zeros(num_parts, dtype=bool)
+    frontier = _sorted_unique(np.asarray(start_indices, dtype=np.int64))
+    visited[frontier] = True
+    levels = [frontier]
+    while frontier.size:
+        neighbors = _csr_gather(indptr, indices, frontier)
+        neighbors = _sorted_unique(neighbors[~visited[neighbors]])
+        visited[neighbors] = True
+        frontier = neighbors.astype(np.int64)
+        levels.append(frontier)
+    reached = np.concatenate(levels)
+    instrumentation.visit(reached.size)
+    return reached
+
+
+class CompiledCausalModel:
+    '''
+    Frozen, integer indexed snapshot of a CausalModel.
+
+    Part n of the snapshot is parts[n] of the source model. Edges are stored as CSR arrays:
+      fwd_indices[fwd_indptr[n]:fwd_indptr[n+1]] - parts that part n causes to fail (CausalPart.causes)
+      rev_indices[rev_indptr[n]:rev_indptr[n+1]] - parts that cause part n to fail (CausalPart.caused_by)
+    Part attributes are stored as arrays aligned with part_ids. observable_order holds the indices of
+    the source model's observable_parts in their order (the column order of observation matrices);
+    None means the observable parts in index order.
+    '''
+    def __init__(self, part_ids, fwd_indptr, fwd_indices, rev_indptr, rev_indices,
+                 failure_prob, is_observable, is_interactable, observable_order=None):
+        # any sequence is kept as is, e.g. the lazily decoded id table of a memory-mapped model file
+        self.part_ids = part_ids if isinstance(part_ids, Sequence) else list(part_ids)
+        self._index_of = None
+        self.fwd_indptr = fwd_indptr
+        self.fwd_indices = fwd_indices
+        self.rev_indptr = rev_indptr
+        self.rev_indices = rev_indices
+        self.failure_prob = failure_prob
+        self.is_observable = is_observable
+        self.is_interactable = is_interactable
+        self.observable_order = observable_order
+
+    @classmethod
+    def from_edges(cls, part_ids, sources, targets, failure_prob=None, is_observable=None, is_interactable=None,
+                   observable_order=None):
+        '''
+        Builds a compiled model from an edge list where sources[k] causes targets[k] to fail.
+        sources and targets are integer indices into part_ids. Duplicate edges are dropped.
+        Raises ValueError for edge indices outside 0..len(part_ids)-1.
+        '''
+        num_parts = len(part_ids)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if sources.shape != targets.shape or sources.ndim != 1:
+            raise ValueError('sources and targets must be 1-D arrays of the same length, got shapes %s and %s'
+                             % (sources.shape, targets.shape))
+        for name, indices in (('source', sources), ('target', targets)):
+            if indices.size and (indices.min() < 0 or indices.max() >= num_parts):
+                bad = indices[(indices < 0) | (indices >= num_parts)][0]
+                raise ValueError('%s index %d is outside the %d parts' % (name, bad, num_parts))
+        # deduplicating also sorts the edges by (source, target), which keeps every CSR neighbor list sorted
+        if sources.size:
+            edge_keys = _sorted_unique(sources * num_parts + targets)
+            sources, targets = np.divmod(edge_keys, num_parts)
+
+        fwd_indptr, fwd_indices = _csr_from_edges(num_parts, sources, targets)
+        rev_indptr, rev_indices = _csr_from_edges(num_parts, targets, sources)
+
+        if failure_prob is None:
+            failure_prob = np.full(num_parts, np.nan)
+        if is_observable is None:
+            is_observable = np.zeros(num_parts, dtype=bool)
+        if is_interactable is None:
+            is_interactable = np.ones(num_parts, dtype=bool)
+        if observable_order is not None:
+            observable_order = np.asarray(observable_order, dtype=np.int64)
+
+        return cls(part_ids, fwd_indptr, fwd_indices, rev_indptr, rev_indices,
+                   np.asarray(failure_prob, dtype=np.float64),
+                   np.asarray(is_observable, dtype=bool),
+                   np.asarray(is_interactable, dtype=bool),
+                   observable_order)
+
+    @classmethod
+    def from_matrix(cls, matrix, part_ids=None):
+        '''
+        Builds a compiled model from a connectivity matrix where matrix[i, j] != 0 means part i causes
+        part j to fail (the format of the circuit matrices in causal_algorithms).
+        matrix can be an NxN dense array, a scipy.sparse matrix or a (sources, targets) tuple of COO
+        edge index arrays. Parts are labelled 0..N-1 unless part_ids is given, part ids must be unique.
+        Raises ValueError for a matrix which is not square, part_ids of the wrong length or with duplicates,
+        and COO indices outside the parts.
+        '''
+        if isinstance(matrix, tuple):
+            if len(matrix) != 2:
+                raise ValueError('COO input must be a (sources, targets) tuple, got %d arrays' % len(matrix))
+            sources, targets = (np.asarray(indices, dtype=np.int64) for indices in matrix)
+            if part_ids is not None:
+                num_parts = len(part_ids)
+            else:
+                num_parts = int(max(sources.max(initial=-1), targets.max(initial=-1))) + 1
+        elif hasattr(matrix, 'tocoo'):
+            # scipy.sparse, read through its COO form so scipy itself is not needed here
+            coo = matrix.tocoo()
+            if coo.shape[0] != coo.shape[1]:
+                raise ValueError('connectivity matrix must be square, got shape %s' % (coo.shape,))
+            nonzero = coo.data != 0
+            sources, targets = coo.row[nonzero], coo.col[nonzero]
+            num_parts = coo.shape[0]
+        else:
+            matrix = np.asarray(matrix)
+            if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+                raise ValueError('connectivity matrix must be square, got shape %s' % (matrix.shape,))
+            sources, targets = np.nonzero(matrix)
+            num_parts = matrix.shape[0]
+
+        if part_ids is None:
+            part_ids = list(range(num_parts))
+        elif len(part_ids) != num_parts:
+            raise ValueError('%d part ids for a matrix of %d parts' % (len(part_ids), num_parts))
+        else:
+            seen = set()
+            for part_id in part_ids:
+                if part_id in seen:
+                    raise ValueError('duplicate part id %r' % (part_id,))
+                seen.add(part_id)
+        return cls.from_edges(part_ids, sources, targets)
+
+    @classmethod
+    def from_causal_model(cls, causal_model):
+        '''compiles the current state of a CausalModel'''
+        part_ids = [part.part_id for part in causal_model.parts]
+        index_of = {part: idx for idx, part in enumerate(causal_model.parts)}
+
+        sources = []
+        targets = []
+        for part_idx, part in enumerate(causal_model.parts):
+            for cause in part.causes:
+                sources.append(part_idx)
+                targets.append(index_of[cause])
+
+        failure_prob = [part.failure_prob for part in causal_model.parts]
+        is_observable = [part.is_observable for part in causal_model.parts]
+        is_interactable = [part.is_interactable for part in causal_model.parts]
+        index_of_id = {part_id: idx for idx, part_id in enumerate(part_ids)}
+        observable_order = [index_of_id[part_id] for part_id in causal_model.observable_parts]
+        return cls.from_edges(part_ids, sources, targets, failure_prob, is_observable, is_interactable,
+                              observable_order)
+
+    @property
+    def index_of(self):
+        '''dict of part id -> index, built on first use'''
+        if self._index_of is None:
+            self._index_of = {part_id: idx for idx, part_id in enumerate(self.part_ids)}
+        return self._index_of
+
+    @property
+    def num_parts(self):
+        return len(self.part_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.fwd_indices)
+
+    def get_index(self, part_id):
+        return self.index_of[part_id]
+
+    def get_indices(self, part_ids):
+        return np.array([self.index_of[part_id] for part_id in part_ids], dtype=np.int64)
+
+    def get_part_ids(self, indices):
+        return [self.part_ids[idx] for idx in indices]
+
+    def observable_indices(self):
+        '''indices of the observable parts, in the order of the source model's observable_parts'''
+        if self.observable_order is not None:
+            return self.observable_order
+        return np.flatnonzero(self.is_observable)
+
+    def interactable_indices(self):
+        return np.flatnonzero(self.is_interactable)
+
+    def ancestors(self, indices):
+        '''
+        Returns the indices of all parts which can cause any of the given parts to fail,
+        including the given parts themselves. Equivalent to find_all_causes_for_part.
+        '''
+        return _csr_closure(self.rev_indptr, self.rev_indices, np.atleast_1d(indices), self.num_parts)
+
+    def descendants(self, indices):
+        '''
+        Returns the indices of all parts which fail when any of the given parts fail,
+        including the given parts themselves. Equivalent to find_failures_caused_by_part.
+        '''
+        return _csr_closure(self.fwd_indptr, self.fwd_indices, np.atleast_1d(indices), self.num_parts)
@@ -0,0 +1,171 @@
+import numpy as np
+
+import instrumentation
+from compiled_causal_model import _csr_from_edges, _csr_gather, _csr_closure, _sorted_unique
+
+
+def strongly_connected_components(num_parts, indptr, indices):
+    '''
+    Iterative Tarjan's algorithm over a CSR graph.
+    Returns (labels, num_components) where labels[n] is the component of part n.
+    Components are numbered in reverse topological order: for an edge u -> v between two
+    different components, labels[v] < labels[u].
+    '''
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+    order = [-1] * num_parts
+    low = [0] * num_parts
+    on_stack = [False] * num_parts
+    labels = [-1] * num_parts
+    stack = []
+    counter = 0
+    num_components = 0
+
+    for root in range(num_parts):
+        if order[root] != -1:
+            continue
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [[root, indptr[root]]]
+        while work:
+            frame = work[-1]
+            part, ptr = frame
+            if ptr < indptr[part + 1]:
+                frame[1] += 1
+                neighbor = indices[ptr]
+                if order[neighbor] == -1:
+                    order[neighbor] = low[neighbor] = counter
+                    counter += 1
+                    stack.append(neighbor)
+                    on_stack[neighbor] = True
+                    work.append([neighbor, indptr[neighbor]])
+                elif on_stack[neighbor] and order[neighbor] < low[part]:
+                    low[part] = order[neighbor]
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                if low[part] < low[parent]:
+                    low[parent] = low[part]
+            if low[part] == order[part]:
+                # part is the root of a component, pop its members off the stack
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    labels[member] = num_components
+                    if member == part:
+                        break
+                num_components += 1
+
+    return np.array(labels, dtype=np.int64), num_components
+
+
+class CondensedCausalModel:
+    '''
+    Strongly connected component condensation of a CompiledCausalModel.
+
+    Every component (e.g. the L1 <-> i1 loop of a circuit) becomes one super-node and the edges
+    between components form a DAG. Closure and planning queries run on the DAG and are expanded
+    back to part indices through the component member lists:
+      members[member_indptr[c]:member_indptr[c+1]] - part indices of component c
+      fwd_indices[fwd_indptr[c]:fwd_indptr[c+1]]   - components c causes to fail
+      rev_indices[rev_indptr[c]:rev_indptr[c+1]]   - components which cause c to fail
+    '''
+    def __init__(self, compiled):
+        self.compiled = compiled
+        self.num_parts = compiled.num_parts
+        self.labels, self.num_components = strongly_connected_components(
+            self.num_parts, compiled.fwd_indptr, compiled.fwd_indices)
+
+        self.members = np.argsort(self.labels, kind='stable')
+        self.member_indptr = np.zeros(self.num_components + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.labels, minlength=self.num_components), out=self.member_indptr[1:])
+
+        sources = np.repeat(np.arange(self.num_parts), np.diff(compiled.fwd_indptr))
+        source_labels = self.labels[sources]
+        target_labels = self.labels[compiled.fwd_indices]
+        between = source_labels != target_labels
+        dag_keys = _sorted_unique(source_labels[between] * self.num_components + target_labels[between])
+        dag_sources, dag_targets = np.divmod(dag_keys, max(self.num_components, 1))
+        self.fwd_indptr, self.fwd_indices = _csr_from_edges(self.num_components, dag_sources, dag_targets)
+        self.rev_indptr, self.rev_indices = _csr_from_edges(self.num_components, dag_targets, dag_sources)
+
+        self._observable_signatures = None
+
+    @property
+    def num_dag_edges(self):
+        return len(self.fwd_indices)
+
+    def component_members(self, component):
+        return self.members[self.member_indptr[component]:self.member_indptr[component + 1]]
+
+    def expand(self, components):
+        '''returns the part indices of all the given components'''
+        return _csr_gather(self.member_indptr, self.members, np.asarray(components, dtype=np.int64))
+
+    def ancestor_components(self, idx):
+        return _csr_closure(self.rev_indptr, self.rev_indices, self.labels[np.atleast_1d(idx)], self.num_components)
+
+    def descendant_components(self, idx):
+        return _csr_closure(self.fwd_indptr, self.fwd_indices, self.labels[np.atleast_1d(idx)], self.num_components)
+
+    def ancestors(self, idx):
+        '''part indices which can cause part idx to fail, including idx and the rest of its component'''
+        return self.expand(self.ancestor_components(idx))
+
+    def descendants(self, idx):
+        '''part indices which fail when part idx fails, including idx and the rest of its component'''
+        return self.expand(self.descendant_components(idx))
+
+    def observable_signatures(self):
+        '''
+        Returns a list holding, for every part, the sorted tuple of observable part indices its failure breaks.
+        Signatures are computed once per component in reverse topological order (successors first).
+        '''
+        if self._observable_signatures is None:
+            observable = self.compiled.is_observable
+            component_signatures = [None] * self.num_components
+            for component in range(self.num_components):
+                signature = set(idx for idx in self.component_members(component).tolist() if observable[idx])
+                for successor in self.fwd_indices[self.fwd_indptr[component]:self.fwd_indptr[component + 1]].tolist():
+                    signature.update(component_signatures[successor])
+                component_signatures[component] = frozenset(signature)
+            self._observable_signatures = [tuple(sorted(component_signatures[label]))
+                                           for label in self.labels.tolist()]
+        return self._observable_signatures
+
+    def plan(self, broken_idx, rng=None):
+        '''
+        Breadth-first plan of part indices to check for a failure observed at broken_idx.
+        The broken part comes first, then the rest of its component, then the components which can
+        cause it to fail level by level. Members of a component are always checked back to back.
+        rng (a numpy Generator) shuffles the order within each component and each BFS level.
+        '''
+        broken_component = self.labels[broken_idx]
+        broken_members = self.component_members(broken_component)
+        others = broken_members[broken_members != broken_idx]
+        if rng is not None:
+            others = rng.permutation(others)
+        plan = [np.array([broken_idx], dtype=np.int64), others]
+
+        visited = np.zeros(self.num_components, dtype=bool)
+        visited[broken_component] = True
+        num_visited = 1
+        frontier = np.array([broken_component], dtype=np.int64)
+        while frontier.size:
+            neighbors = _csr_gather(self.rev_indptr, self.rev_indices, frontier)
+            neighbors = _sorted_unique(neighbors[~visited[neighbors]])
+            visited[neighbors] = True
+            num_visited += neighbors.size
+            if rng is not None:
+                neighbors = rng.permutation(neighbors)
+            for component in neighbors:
+                members = self.component_members(component)
+                plan.append(rng.permutation(members) if rng is not None else members)
+            frontier = neighbors.astype(np.int64)
+        # components walked, their members are only listed
+        instrumentation.visit(num_visited)
+        return np.concatenate(plan)
@@ -0,0 +1,107 @@
+import itertools
+import random
+
+import numpy as np
+
+from causal_graph_structure import CausalModel
+
+
+def build_random_model(num_parts, num_edges, seed, num_observable=0, num_non_interactable=0, model_class=CausalModel):
+    '''
+    CausalModel over parts 'p0'..'p{num_parts-1}' with num_edges random edges (cycles and self loops included),
+    random observable and non-interactable parts; the query cache is off so every query walks the graph
+    '''
+    rnd = random.Random(seed)
+    causal_model = model_class()
+    for part_idx in range(num_parts):
+        causal_model.add_part_full('p%d' % part_idx, [], [])
+    for _ in range(num_edges):
+        causal_model.add_part_full('p%d' % rnd.randrange(num_parts), [], ['p%d' % rnd.randrange(num_parts)])
+    part_ids = [part.part_id for part in causal_model.parts]
+    if num_observable:
+        causal_model.set_observable_parts(rnd.sample(part_ids, num_observable))
+    if num_non_interactable:
+        causal_model.set_non_interactable_parts(rnd.sample(part_ids, num_non_interactable))
+    causal_model.set_query_cache_size(0)
+    return causal_model
+
+
+def reference_closure(part, neighbor_attr, reached=None):
+    '''recursive walk along neighbor_attr, the way the queries were originally written'''
+    if reached is None:
+        reached = set()
+    reached.add(part.part_id)
+    for next_part in getattr(part, neighbor_attr):
+        if next_part.part_id not in reached:
+            reference_closure(next_part, neighbor_attr, reached)
+    return reached
+
+
+def reference_root_causes(causal_model, part_ids_working, part_ids_not_working):
+    candidates = {part.part_id for part in causal_model.parts if part.is_interactable}
+    for part_id in part_ids_not_working:
+        candidates &= reference_closure(causal_model.get_part_from_id(part_id), 'caused_by')
+    for part_id in part_ids_working:
+        candidates -= reference_closure(causal_model.get_part_from_id(part_id), 'caused_by')
+    return candidates
+
+
+def random_reports(causal_model, num_reports, seed):
+    rnd = random.Random(seed)
+    reports = []
+    for _ in range(num_reports):
+        observed = rnd.sample(causal_model.observable_parts, rnd.randrange(len(causal_model.observable_parts) + 1))
+        num_failing = rnd.randrange(len(observed) + 1)
+        reports.append((observed[num_failing:], observed[:num_failing]))
+    return reports
+
+
+# reference evaluators: the original per-part loops, every blanket found by walking the graph
+
+def reference_frequency(failure_rates):
+    return sum((rank + 1) * rate for rank, rate in enumerate(sorted(failure_rates, reverse=True)))
+
+
+def reference_blanket(causal_model, part_id):
+    obs_working, obs_failing = causal_model.find_observables_from_failure(part_id)
+    return causal_model.find_potential_root_causes_from_observerables(obs_working, obs_failing)
+
+
+def reference_causal(causal_model, part_ids, failure_rates):
+    return sum((len(reference_blanket(causal_model, part_id)) + 1) / 2 * rate
+               for part_id, rate in zip(part_ids, failure_rates))
+
+
+def reference_combined(causal_model, part_ids, failure_rates):
+    expected_value_total = 0
+    for part_id, rate in zip(part_ids, failure_rates):
+        blanket_rates = causal_model.get_part_failure_rates(reference_blanket(causal_model, part_id))
+        total = sum(blanket_rates)
+        if total > 0:
+            expected_value_total += reference_frequency([blanket_rate / total for blanket_rate in blanket_rates]) * rate
+    return expected_value_total
+
+
+def reference_permutation_average(causal_model, distribution):
+    '''average of (E[M_f], E[M_c], E[M_cf]) over itertools.permutations of the interactable parts'''
+    part_ids = causal_model.get_interactable_part_ids()
+    sums = np.zeros(3)
+    num_permutations = 0
+    for parts_list in itertools.permutations(part_ids):
+        causal_model.set_part_failure_rates(parts_list, distribution)
+        failure_rates = causal_model.get_part_failure_rates(part_ids)
+        sums += (reference_frequency(failure_rates), reference_causal(causal_model, part_ids, failure_rates),
+                 reference_combined(causal_model, part_ids, failure_rates))
+        num_permutations += 1
+    return sums / num_permutations
+
+
+def random_case(seed, num_parts=8, num_edges=10, num_observable=3, num_non_interactable=3):
+    '''two identical random models (one stays free of indexes for the reference) and a distribution'''
+    models = [build_random_model(num_parts, num_edges, seed, num_observable, num_non_interactable) for _ in range(2)]
+    num_interactable = len(models[0].get_interactable_part_ids())
+    distribution = np.random.default_rng(seed).random(num_interactable)
+    if seed % 3 == 0:
+        # ties and zero rates, like the step distribution
+        distribution = (np.arange(num_interactable) < 3).astype(float)
+    return models[0], models[1], (distribution / distribution.sum()).tolist()
@@ -0,0 +1,305 @@
+'''
+Asyncio diagnosis service with micro-batching.
+
+Every request is an observation report (parts seen working, parts seen failing) and is answered with
+the potential root causes of find_potential_root_causes_from_observerables, ranked by their failure
+probability renormalized over the candidates. Requests arriving within window seconds of each other
+(or max_batch of them) are evaluated together in one worker thread call against a read-only snapshot
+of the model, so the event loop only queues requests while the latency stays bounded by the window
+plus one batch. Each report is a few AND / ANDNOT operations over the packed ancestor rows of the
+reachability index; small models use the dense candidate matrix product
+(ReachabilityIndex.root_cause_candidate_matrix) for the whole batch instead.
+
+In-process:
+
+  service = DiagnosisService(causal_model)
+  candidates = await service.diagnose(['L2'], ['L1'])   # [(part id, probability), ...]
+
+Over a local socket, one JSON object per line in each direction:
+
+  request   {"id": 7, "working": ["L2"], "failing": ["L1"], "limit": 5}
+  response  {"id": 7, "candidates": [["R1", 0.5], ["L1", 0.5]]}   or   {"id": 7, "error": "..."}
+
+  python diagnosis_service.py model.bin --port 8765
+'''
+import argparse
+import asyncio
+import json
+
+import numpy as np
+
+from compiled_causal_model import CompiledCausalModel, _sorted_unique
+from reachability import OBSERVATION_FAILING, OBSERVATION_UNKNOWN, OBSERVATION_WORKING, ReachabilityIndex
+
+# the dense candidate matrix unpacks an (observed parts x parts) matrix and multiplies it for the whole
+# batch; it only beat the per report word operations (python benchmark.py, diagnosis_batch_*) on models
+# of up to about 500 parts, or about 1000 parts when the reports observed most of the observables
+DENSE_MAX_PARTS = 512
+DENSE_MAX_PARTS_HIGH_COVERAGE = 1024
+DENSE_MIN_COVERAGE = 0.75
+
+
+class DiagnosisService:
+    '''
+    Micro-batching front-end over a snapshot of a causal model.
+    Inputs:
+      causal_model - CausalModel (compiled once, later changes to it are not seen) or CompiledCausalModel
+      window - seconds the first request of a batch waits for more requests
+      max_batch - a batch is evaluated as soon as it holds this many requests
+    '''
+    def __init__(self, causal_model, window=0.002, max_batch=256):
+        if isinstance(causal_model, CompiledCausalModel):
+            self.compiled = causal_model
+        else:
+            self.compiled = causal_model.compile()
+        self.index = ReachabilityIndex(self.compiled)
+        self.failure_prob = np.where(self.compiled.is_interactable, np.nan_to_num(self.compiled.failure_prob), 0.0)
+        self.failure_prob.flags.writeable = False
+        self.num_observables = len(self.compiled.observable_indices())
+        self.window = window
+        self.max_batch = max_batch
+
+        self._pending = []
+        self._flush_handle = None
+        self._batch_tasks = set()
+        self.num_requests = 0
+        self.num_batches = 0
+
+    async def diagnose(self, part_ids_working=(), part_ids_not_working=(), limit=None):
+        '''
+        returns the ranked [(part id, probability), ...] root cause candidates of one report,
+        at most limit of them; unknown part ids and a limit which is not a non-negative int or None raise ValueError
+        '''
+        # checked here, a bad report must not reach the batch it would share with other callers
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 0):
+            raise ValueError('limit must be a non-negative int or None, got ' + repr(limit))
+        try:
+            working = self.compiled.get_indices(part_ids_working)
+            failing = self.compiled.get_indices(part_ids_not_working)
+        except KeyError as error:
+            raise ValueError('unknown part id ' + repr(error.args[0])) from None
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((working, failing, limit), future))
+        self.num_requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            # keep a reference until the batch is done, the loop only holds weak ones
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch):
+        self.num_batches += 1
+        reports = [report for report, _ in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, self.evaluate_batch, reports)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            # a request whose caller went away is simply dropped
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def evaluate_batch(self, reports, dense=None):
+        '''
+        Synchronous core of the service: ranked candidates of every (working indices, failing indices, limit)
+        report. dense=None picks the candidate computation with use_dense, True / False force the dense
+        matrix or the per report word operations. A report which can not be evaluated gets its exception
+        in place of its result, the other reports of the batch are not affected.
+        '''
+        if dense is None:
+            dense = self.use_dense(reports)
+        if dense:
+            try:
+                candidates = self._candidate_matrix(reports)
+            except Exception:
+                # evaluate the reports one by one so only the broken ones fail
+                dense = False
+
+        results = []
+        for row, (working, failing, limit) in enumerate(reports):
+            try:
+                if dense:
+                    candidate_indices = np.flatnonzero(candidates[row])
+                else:
+                    candidate_indices = self.index.root_cause_candidates(working, failing)
+                results.append(self.rank(candidate_indices, limit))
+            except Exception as error:
+                results.append(error)
+        return results
+
+    def use_dense(self, reports):
+        '''True when the dense candidate matrix is expected to be faster for the batch (see DENSE_MAX_PARTS)'''
+        if self.compiled.num_parts <= DENSE_MAX_PARTS:
+            return True
+        if self.compiled.num_parts > DENSE_MAX_PARTS_HIGH_COVERAGE or not self.num_observables:
+            return False
+        num_observed = sum(working.size + failing.size for working, failing, _ in reports)
+        return num_observed >= DENSE_MIN_COVERAGE * self.num_observables * len(reports)
+
+    def _candidate_matrix(self, reports):
+        '''R x N candidate matrix of the reports, one matrix product over the parts observed anywhere in the batch'''
+        workings = [working for working, _, _ in reports]
+        failings = [failing for _, failing, _ in reports]
+        columns = _sorted_unique(np.concatenate(workings + failings + [np.empty(0, dtype=np.int64)]))
+        working_rows = np.repeat(np.arange(len(reports)), [working.size for working in workings])
+        failing_rows = np.repeat(np.arange(len(reports)), [failing.size for failing in failings])
+        working_columns = np.searchsorted(columns, np.concatenate(workings + [np.empty(0, dtype=np.int64)]))
+        failing_columns = np.searchsorted(columns, np.concatenate(failings + [np.empty(0, dtype=np.int64)]))
+
+        observations = np.full((len(reports), columns.size), OBSERVATION_UNKNOWN, dtype=np.int8)
+        observations[failing_rows, failing_columns] = OBSERVATION_FAILING
+        # a part seen both working and failing leaves no candidate, as in the graph query
+        conflicting = np.zeros(len(reports), dtype=bool)
+        conflicting[working_rows[observations[working_rows, working_columns] == OBSERVATION_FAILING]] = True
+        observations[working_rows, working_columns] = OBSERVATION_WORKING
+        candidates = self.index.root_cause_candidate_matrix(columns, observations)
+        candidates[conflicting] = False
+        return candidates
+
+    def rank(self, candidate_indices, limit=None):
+        '''[(part id, probability), ...] of the candidates, most likely first, uniform when they have no rates'''
+        rates = self.failure_prob[candidate_indices]
+        total = rates.sum()
+        if total > 0:
+            probabilities = rates / total
+        else:
+            probabilities = np.full(candidate_indices.size, 1.0 / max(candidate_indices.size, 1))
+        order = np.argsort(-probabilities, kind='stable')[:limit]
+        return [(self.compiled.part_ids[idx], probability)
+                for idx, probability in zip(candidate_indices[order].tolist(), probabilities[order].tolist())]
+
+    def stats(self):
+        return {'requests': self.num_requests, 'batches': self.num_batches,
+                'mean_batch_size': self.num_requests / self.num_batches if self.num_batches else 0.0}
+
+    async def _handle_request(self, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            candidates = await self.diagnose(request.get('working', ()), request.get('failing', ()),
+                                             request.get('limit'))
+            response = {'id': request_id, 'candidates': candidates}
+        except (ValueError, TypeError, AttributeError) as error:
+            response = {'id': request_id, 'error': str(error)}
+        writer.write((json.dumps(response) + '\n').encode('utf-8'))
+
+    async def handle_connection(self, reader, writer):
+        '''serves one connection; requests are answered as they complete, so pipelined ones share batches'''
+        requests = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.get_running_loop().create_task(self._handle_request(line, writer))
+                requests.add(task)
+                task.add_done_callback(requests.discard)
+            if requests:
+                await asyncio.gather(*requests)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def start_server(self, host='127.0.0.1', port=0, path=None):
+        '''starts serving on a TCP port of host, or on the unix socket at path, returns the asyncio Server'''
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_connection, path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+class DiagnosisClient:
+    '''client for a DiagnosisService socket; concurrent diagnose calls are pipelined on one connection'''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._next_id = 0
+        self._waiting = {}
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_responses())
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=None, path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _read_responses(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self._waiting.pop(response['id'], None)
+            if future is None or future.done():
+                continue
+            if 'error' in response:
+                future.set_exception(ValueError(response['error']))
+            else:
+                future.set_result([tuple(candidate) for candidate in response['candidates']])
+        for future in self._waiting.values():
+            if not future.done():
+                future.set_exception(ConnectionError('diagnosis service closed the connection'))
+        self._waiting.clear()
+
+    async def diagnose(self, part_ids_working=(), part_ids_not_working=(), limit=None):
+        request_id = self._next_id
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        request = {'id': request_id, 'working': list(part_ids_working), 'failing': list(part_ids_not_working),
+                   'limit': limit}
+        self.writer.write((json.dumps(request) + '\n').encode('utf-8'))
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self._reader_task
+
+
+async def serve(model_path, host='127.0.0.1', port=8765, path=None, window=0.002, max_batch=256):
+    from model_file import load_compiled_model
+
+    service = DiagnosisService(load_compiled_model(model_path), window, max_batch)
+    server = await service.start_server(host, port, path)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serves root cause queries for a model file over a local socket.')
+    parser.add_argument('model', help='model file written by CausalModel.save')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix-socket', help='serve on this unix socket path instead of TCP')
+    parser.add_argument('--window-ms', type=float, default=2.0, help='micro-batching window')
+    parser.add_argument('--max-batch', type=int, default=256)
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.model, args.host, args.port, args.unix_socket, args.window_ms / 1000, args.max_batch))
+
+
+if __name__ == "__main__":
+    main()
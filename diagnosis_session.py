@@ -0,0 +1,98 @@
+import numpy as np
+
+from reachability import indices_from_bits, pack_bits, unpack_bits
+
+
+class DiagnosisSession:
+    '''
+    Live root cause candidates of one troubleshooting session.
+
+    The candidates are a packed bitmap over the parts of the model's reachability index. A failing
+    part keeps only its ancestors and a working part removes its ancestors, each an O(words) update
+    against the precomputed rows, so after any sequence of observations the candidates equal
+    find_potential_root_causes_from_observerables on the full working/not-working lists.
+    Every update pushes the previous bitmap, which undo restores.
+    The session keeps the index it was started with, start a new one after changing the graph.
+    '''
+    def __init__(self, causal_model):
+        self.causal_model = causal_model
+        self.index = causal_model._reachability if causal_model._reachability is not None \
+            else causal_model.build_reachability_index()
+        self.compiled = self.index.compiled
+        self.candidate_words = self.index.interactable_words.copy()
+        self.history = [] # (part id, is_working) per update, is_working is None for ruled out parts
+        self._undo_stack = []
+        self._planner = None
+
+    def _apply(self, candidate_words, entry):
+        self._undo_stack.append(self.candidate_words)
+        self.history.append(entry)
+        self.candidate_words = candidate_words
+
+    def observe(self, part_id, is_working):
+        '''records a part observed working or failing'''
+        row = self.index.ancestor_row(self.compiled.get_index(part_id))
+        self._apply(self.candidate_words & ~row if is_working else self.candidate_words & row, (part_id, is_working))
+
+    def observe_working(self, part_id):
+        self.observe(part_id, True)
+
+    def observe_failing(self, part_id):
+        self.observe(part_id, False)
+
+    def rule_out(self, part_id):
+        '''records a part which was checked directly and is not the root cause'''
+        excluded = np.zeros(self.compiled.num_parts, dtype=bool)
+        excluded[self.compiled.get_index(part_id)] = True
+        self._apply(self.candidate_words & ~pack_bits(excluded), (part_id, None))
+
+    def undo(self):
+        '''reverts the last observation and returns it as (part id, is_working)'''
+        if not self._undo_stack:
+            raise ValueError('no observation to undo')
+        self.candidate_words = self._undo_stack.pop()
+        return self.history.pop()
+
+    def reset(self):
+        self.candidate_words = self.index.interactable_words.copy()
+        self.history = []
+        self._undo_stack = []
+
+    def candidate_indices(self):
+        return indices_from_bits(self.candidate_words, self.compiled.num_parts)
+
+    def candidates(self):
+        '''ids of the interactable parts consistent with every observation so far'''
+        return self.compiled.get_part_ids(self.candidate_indices())
+
+    def num_candidates(self):
+        return int(np.count_nonzero(unpack_bits(self.candidate_words, self.compiled.num_parts)))
+
+    def candidate_probabilities(self):
+        '''
+        returns a dict candidate part id -> failure_prob renormalized over the candidates,
+        uniform when the candidates have no failure rates set
+        '''
+        candidate_ids = self.candidates()
+        rates = np.nan_to_num(np.array(self.causal_model.get_part_failure_rates(candidate_ids), dtype=np.float64))
+        if not rates.sum() > 0:
+            rates = np.ones(len(candidate_ids))
+        return dict(zip(candidate_ids, (rates / rates.sum()).tolist()))
+
+    def ranked_candidates(self):
+        '''(part id, probability) of every candidate, most likely first'''
+        return sorted(self.candidate_probabilities().items(), key=lambda item: item[1], reverse=True)
+
+    def next_check(self, observation_cost=1.0):
+        '''
+        the (CHECK_OBSERVABLE or CHECK_PART, part id) with the largest expected information gain
+        for the current candidates and the model's current failure rates, see InformationGainPlanner
+        '''
+        if self._planner is None or self._planner.observation_cost != observation_cost:
+            self._planner = self.causal_model.get_information_gain_planner(observation_cost)
+        # the planner is reused across calls, its own copy of the rates goes stale after a rate change
+        prior = self._planner.prior(self.causal_model.get_failure_rate_array())
+        check = self._planner.select_check(self.candidate_words, prior)
+        if check is None:
+            return None
+        return check[0], self.compiled.part_ids[check[1]]
@@ -0,0 +1,213 @@
+'''
+Permutation averaged expected instruction counts.
+
+The experiments in instruction_efficiency assign a failure rate distribution to the interactable
+parts in every possible order and average E[M_f], E[M_c] and E[M_cf] over the orders. All three
+only depend on the multiset of rates and on the sizes of the fault-signature classes (the Markov
+blankets), so the average has a closed form:
+
+  r_(1) >= ... >= r_(N) - the distribution sorted descending, N interactable parts
+  s_k                   - number of interactable parts in signature class k
+
+  E[M_f]  = sum_i i * r_(i)
+  E[M_c]  = mean(r) * sum_k s_k * (s_k + 1) / 2
+  E[M_cf] = sum_i r_(i) * (1 + (i - 1) * sum_k s_k * (s_k - 1) / (N * (N - 1)))
+
+E[M_cf] follows from each class receiving a uniformly random subset of the rates: r_(i) lands in
+class k with probability s_k / N and is then checked after on average (s_k - 1) * (i - 1) / (N - 1)
+of the i - 1 larger rates which also landed in class k.
+'''
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from instrumentation import instrumented
+
+
+def expected_value_frequency(failure_rates):
+    '''E[M_f] = sum_{n=1}^{N}(P(p_{n-1})*n) with the rates sorted descending, the input is not modified'''
+    rates = -np.sort(-np.asarray(failure_rates, dtype=np.float64))
+    return np.dot(np.arange(1, rates.size + 1), rates)
+
+
+def expected_value_causal(signatures, part_indices, failure_rates):
+    '''
+    E[M_c] = sum(E[Mb|p_n] * P(p_n)) with E[Mb|p_n] = (|Mb| + 1) / 2, evaluated for all parts at once.
+    Inputs:
+      signatures - FaultSignatureTable of the model
+      part_indices - indices of the parts p_n
+      failure_rates - P(p_n), aligned with part_indices
+    '''
+    part_indices = np.asarray(part_indices, dtype=np.int64)
+    blanket_sizes = signatures.class_sizes[signatures.class_of_part[part_indices]]
+    return np.dot((blanket_sizes + 1) / 2, np.asarray(failure_rates, dtype=np.float64))
+
+
+def expected_value_blankets_frequency(signatures, failure_prob):
+    '''
+    E[M_f] of the frequency ordered search inside every Markov blanket (signature class), with the
+    blanket rates renormalized. Returns one value per class, 0 where the blanket has no failure mass.
+    failure_prob holds the rate of every part of the model, indexed like signatures.compiled.
+    '''
+    members = np.flatnonzero(signatures.is_interactable)
+    classes = signatures.class_of_part[members]
+    rates = np.asarray(failure_prob, dtype=np.float64)[members]
+
+    # sort by class, then by rate descending; the rank inside a class is the offset from the class start
+    order = np.lexsort((-rates, classes))
+    classes = classes[order]
+    rates = rates[order]
+    class_starts = np.searchsorted(classes, classes, side='left')
+    ranks = np.arange(1, rates.size + 1) - class_starts
+
+    weighted = np.bincount(classes, weights=ranks * rates, minlength=signatures.num_classes)
+    totals = np.bincount(classes, weights=rates, minlength=signatures.num_classes)
+    expected_values = np.zeros(signatures.num_classes)
+    np.divide(weighted, totals, out=expected_values, where=totals > 0)
+    return expected_values
+
+
+def expected_value_combined(signatures, part_indices, failure_rates, failure_prob=None):
+    '''
+    E[M_cf] = sum(E[M_f|Mb(p_n)] * P(p_n)), the frequency ordered search inside the Markov blanket of p_n.
+    Inputs:
+      signatures - FaultSignatureTable of the model
+      part_indices - indices of the parts p_n
+      failure_rates - P(p_n), aligned with part_indices
+      failure_prob - rate of every part of the model used inside the blankets, defaults to failure_rates
+                     at part_indices and 0 elsewhere
+    '''
+    part_indices = np.asarray(part_indices, dtype=np.int64)
+    failure_rates = np.asarray(failure_rates, dtype=np.float64)
+    if failure_prob is None:
+        failure_prob = np.zeros(signatures.compiled.num_parts)
+        failure_prob[part_indices] = failure_rates
+    blanket_values = expected_value_blankets_frequency(signatures, failure_prob)
+    return np.dot(blanket_values[signatures.class_of_part[part_indices]], failure_rates)
+
+
+def signature_class_sizes(causal_model):
+    '''number of interactable parts in every fault-signature class of the model'''
+    class_sizes = causal_model.get_fault_signature_table().class_sizes
+    return class_sizes[class_sizes > 0]
+
+
+def expected_values_exact(class_sizes, distribution):
+    '''
+    Closed form permutation average of (E[M_f], E[M_c], E[M_cf]).
+    Inputs:
+      class_sizes - interactable part count of every signature class, sums to N
+      distribution - N failure rates, assigned to the parts in every possible order
+    '''
+    expected_values = expected_values_exact_batch(class_sizes, np.atleast_2d(distribution))
+    return tuple(values[0] for values in expected_values)
+
+
+def expected_values_exact_batch(class_sizes, distributions):
+    '''
+    expected_values_exact for every row of a D x N matrix of distributions.
+    Returns three length D arrays (E[M_f], E[M_c], E[M_cf]).
+    '''
+    class_sizes = np.asarray(class_sizes, dtype=np.float64)
+    rates = -np.sort(-np.asarray(distributions, dtype=np.float64), axis=1)
+    num_parts = rates.shape[1]
+    assert class_sizes.sum() == num_parts
+
+    ranks = np.arange(1, num_parts + 1)
+    expected_value_f = rates @ ranks
+    expected_value_c = rates.mean(axis=1) * np.sum(class_sizes * (class_sizes + 1) / 2)
+    if num_parts > 1:
+        pair_fraction = np.sum(class_sizes * (class_sizes - 1)) / (num_parts * (num_parts - 1))
+    else:
+        pair_fraction = 0.0
+    expected_value_cf = rates @ (1 + (ranks - 1) * pair_fraction)
+    return expected_value_f, expected_value_c, expected_value_cf
+
+
+def expected_values_for_assignments(class_sizes, rate_matrix):
+    '''
+    (M_f, M_c, M_cf) expectations for explicit rate assignments, one per row of rate_matrix.
+    Column n of rate_matrix is the rate of the n-th interactable part when the parts are ordered
+    class by class (the first class_sizes[0] columns are class 0 and so on).
+    Returns three arrays with one value per row.
+    '''
+    rate_matrix = np.atleast_2d(np.asarray(rate_matrix, dtype=np.float64))
+    num_parts = rate_matrix.shape[1]
+    ranks = np.arange(1, num_parts + 1)
+
+    expected_value_f = -np.sort(-rate_matrix, axis=1) @ ranks
+
+    class_of_column = np.repeat(np.arange(len(class_sizes)), class_sizes)
+    blanket_sizes = np.asarray(class_sizes, dtype=np.float64)[class_of_column]
+    expected_value_c = rate_matrix @ ((blanket_sizes + 1) / 2)
+
+    # sum_{p in class} r_p * E[frequency order within class] = sum_j j * (class rates sorted descending)_j
+    expected_value_cf = np.zeros(rate_matrix.shape[0])
+    start = 0
+    for class_size in class_sizes:
+        block = rate_matrix[:, start:start + class_size]
+        expected_value_cf += -np.sort(-block, axis=1) @ np.arange(1, class_size + 1)
+        start += class_size
+    return expected_value_f, expected_value_c, expected_value_cf
+
+
+def expected_values_monte_carlo(class_sizes, distribution, num_samples=10000, rng=None, confidence=0.95):
+    '''
+    Estimates the permutation average of (E[M_f], E[M_c], E[M_cf]) from num_samples random assignments.
+    Returns (means, half_widths): two length 3 arrays, the true averages lie in means +- half_widths
+    with the given confidence (normal approximation).
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    distribution = np.asarray(distribution, dtype=np.float64)
+    rate_matrix = distribution[rng.permuted(np.tile(np.arange(distribution.size), (num_samples, 1)), axis=1)]
+    samples = np.array(expected_values_for_assignments(class_sizes, rate_matrix))
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    means = samples.mean(axis=1)
+    half_widths = z * samples.std(axis=1, ddof=1) / math.sqrt(num_samples) if num_samples > 1 else np.full(3, np.inf)
+    return means, half_widths
+
+
+@instrumented()
+def compute_expected_values(causal_model, distribution, method='exact', num_samples=10000, rng=None):
+    '''
+    Permutation averaged (E[M_f], E[M_c], E[M_cf]) of a causal model for a failure rate distribution,
+    matching the average over itertools.permutations(causal_model.get_interactable_part_ids()).
+    method='exact' uses the closed form, method='monte_carlo' samples num_samples permutations and
+    returns (means, half_widths) instead.
+    '''
+    class_sizes = signature_class_sizes(causal_model)
+    if method == 'exact':
+        return expected_values_exact(class_sizes, distribution)
+    if method == 'monte_carlo':
+        return expected_values_monte_carlo(class_sizes, distribution, num_samples, rng)
+    raise ValueError('unknown method: ' + str(method))
+
+
+@instrumented()
+def compute_expected_values_batch(causal_model, distributions):
+    '''
+    compute_expected_values (exact) for a D x N matrix of distributions, e.g. a grid of geometric r values.
+    The signature classes are derived once and every row is evaluated in the same vectorized pass.
+    Returns three length D arrays (E[M_f], E[M_c], E[M_cf]).
+    '''
+    return expected_values_exact_batch(signature_class_sizes(causal_model), distributions)
+
+
+@instrumented()
+def compute_expected_values_for_rates(causal_model, rate_matrix):
+    '''
+    (E[M_f], E[M_c], E[M_cf]) for fixed rate assignments instead of the permutation average.
+    Row d of rate_matrix holds the failure rate of every interactable part, columns ordered like
+    causal_model.get_interactable_part_ids(). The model's own failure rates are not touched.
+    Returns three length D arrays.
+    '''
+    signatures = causal_model.get_fault_signature_table()
+    interactable_indices = signatures.compiled.get_indices(causal_model.get_interactable_part_ids())
+    # expected_values_for_assignments wants the columns grouped class by class
+    column_order = np.argsort(signatures.class_of_part[interactable_indices], kind='stable')
+    class_sizes = signatures.class_sizes[signatures.class_sizes > 0]
+    rate_matrix = np.atleast_2d(np.asarray(rate_matrix, dtype=np.float64))
+    return expected_values_for_assignments(class_sizes, rate_matrix[:, column_order])
@@ -0,0 +1,166 @@
+'''
+Process pool runner for the instruction efficiency experiments.
+
+Every (model, distribution) pair averages E[M_f], E[M_c] and E[M_cf] over the assignments of the
+distribution to the interactable parts. The assignments are split into permutation chunks which run
+on a concurrent.futures process pool. Workers receive every model once, as an immutable compiled
+snapshot, when they start, so no worker ever touches a shared CausalModel. Partial sums are reduced
+in chunk order with math.fsum, so results do not depend on the number of workers or on scheduling.
+Pairs with more than max_permutations assignments are averaged over seeded random permutations
+instead of enumerated, and work units are generated while the pool drains them, so a large model
+never materializes factorial(n) / chunk_size units.
+'''
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from expected_instructions import expected_values_for_assignments
+from fault_signatures import FaultSignatureTable
+from reachability import ReachabilityIndex
+
+# pairs with more permutations than this are sampled unless run_experiments is told otherwise
+MAX_ENUMERATED_PERMUTATIONS = math.factorial(10)
+# the largest factorial which still fits the int64 ranks of unrank_permutations
+MAX_RANKED_ITEMS = 20
+# work units queued per worker, bounds the futures held at once
+UNITS_IN_FLIGHT_PER_WORKER = 4
+
+# per worker process state, filled in by _init_worker
+_worker_models = {}
+
+
+class _WorkerModel:
+    '''what a worker needs to evaluate assignments: the column layout grouped by signature class'''
+    def __init__(self, compiled, observable_indices):
+        signatures = FaultSignatureTable(ReachabilityIndex(compiled), observable_indices)
+        interactable_indices = compiled.interactable_indices()
+        self.num_parts = len(interactable_indices)
+        # permutations index the interactable parts in model order, columns are grouped by class
+        self.column_order = np.argsort(signatures.class_of_part[interactable_indices], kind='stable')
+        self.class_sizes = signatures.class_sizes[signatures.class_sizes > 0]
+
+
+def _init_worker(compiled_models):
+    _worker_models.clear()
+    for model_name, (compiled, observable_indices) in compiled_models.items():
+        _worker_models[model_name] = _WorkerModel(compiled, observable_indices)
+
+
+def unrank_permutations(ranks, num_items):
+    '''
+    Returns the permutations of range(num_items) with the given lexicographic ranks, one per row,
+    in the order itertools.permutations(range(num_items)) would produce them.
+    Ranks are int64, so num_items is limited to MAX_RANKED_ITEMS (20! < 2**63).
+    '''
+    if num_items > MAX_RANKED_ITEMS:
+        raise ValueError('can not rank permutations of %d items, %d! overflows int64' % (num_items, num_items))
+    ranks = np.asarray(ranks, dtype=np.int64)
+    remaining = np.tile(np.arange(num_items), (ranks.size, 1))
+    permutations = np.empty((ranks.size, num_items), dtype=np.int64)
+    for position in range(num_items):
+        # digit of the factorial number system picks among the items not used yet
+        block = math.factorial(num_items - 1 - position)
+        digits = (ranks // block) % (num_items - position)
+        permutations[:, position] = remaining[np.arange(ranks.size), digits]
+        keep = np.ones(remaining.shape, dtype=bool)
+        keep[np.arange(ranks.size), digits] = False
+        remaining = remaining[keep].reshape(ranks.size, num_items - position - 1)
+    return permutations
+
+
+def _evaluate_chunk(model_name, distribution_key, distribution, start, stop, sample_seed):
+    '''
+    Sums (M_f, M_c, M_cf) over the permutations with ranks start..stop-1, or over stop-start random
+    permutations drawn from sample_seed when sample_seed is not None.
+    '''
+    model = _worker_models[model_name]
+    if sample_seed is None:
+        permutations = unrank_permutations(np.arange(start, stop), model.num_parts)
+    else:
+        rng = np.random.default_rng(sample_seed)
+        permutations = rng.permuted(np.tile(np.arange(model.num_parts), (stop - start, 1)), axis=1)
+
+    # part permutations[k, i] gets distribution[i], as in set_part_failure_rates(parts_list, distrobution)
+    rate_matrix = np.empty(permutations.shape)
+    np.put_along_axis(rate_matrix, permutations, np.asarray(distribution, dtype=np.float64)[None, :], axis=1)
+    sums = [math.fsum(values) for values in
+            expected_values_for_assignments(model.class_sizes, rate_matrix[:, model.column_order])]
+    return model_name, distribution_key, start, stop - start, sums
+
+
+def _work_units(compiled_models, distributions, chunk_size, num_samples, seed, max_permutations):
+    '''
+    yields (model name, distribution key, distribution, start, stop, sample seed) work units lazily,
+    sample seed is None for chunks of enumerated permutation ranks
+    '''
+    seed_sequence = np.random.SeedSequence(seed)
+    for model_name, (compiled, _) in compiled_models.items():
+        num_parts = len(compiled.interactable_indices())
+        exhaustive = (num_samples is None and num_parts <= MAX_RANKED_ITEMS and
+                      math.factorial(num_parts) <= max_permutations)
+        if exhaustive:
+            num_assignments = math.factorial(num_parts)
+        else:
+            num_assignments = max_permutations if num_samples is None else num_samples
+        for distribution_key, distribution in distributions.items():
+            for start in range(0, num_assignments, chunk_size):
+                sample_seed = None if exhaustive else seed_sequence.spawn(1)[0]
+                yield (model_name, distribution_key, distribution,
+                       start, min(start + chunk_size, num_assignments), sample_seed)
+
+
+def run_experiments(models, distributions, max_workers=None, chunk_size=20000, num_samples=None, seed=0,
+                    max_permutations=MAX_ENUMERATED_PERMUTATIONS):
+    '''
+    Permutation averaged expected instruction counts for every model and distribution.
+    Inputs:
+      models - dict of name -> CausalModel
+      distributions - dict of name -> failure rate list, one rate per interactable part
+      max_workers - process pool size, defaults to the number of CPUs
+      chunk_size - permutations per work unit
+      num_samples - None enumerates every permutation of pairs with at most max_permutations of them and
+                    averages max_permutations random permutations for the others; otherwise each pair
+                    averages num_samples random permutations. Random permutations are drawn
+                    reproducibly from seed.
+      max_permutations - largest permutation count which is enumerated
+
+    Outputs:
+      results - dict of (model name, distribution name) -> (E[M_f], E[M_c], E[M_cf])
+    '''
+    if max_permutations < 1:
+        raise ValueError('max_permutations must be positive, got %r' % (max_permutations,))
+    compiled_models = {}
+    for model_name, causal_model in models.items():
+        compiled = causal_model.compile()
+        compiled_models[model_name] = (compiled, compiled.get_indices(causal_model.observable_parts))
+        num_parts = len(compiled.interactable_indices())
+        for distribution in distributions.values():
+            assert len(distribution) == num_parts
+
+    work_units = _work_units(compiled_models, distributions, chunk_size, num_samples, seed, max_permutations)
+    max_in_flight = UNITS_IN_FLIGHT_PER_WORKER * (max_workers or os.cpu_count() or 1)
+    partials = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(compiled_models,)) as executor:
+        pending = set()
+        for work_unit in work_units:
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect_partials(done, partials)
+            pending.add(executor.submit(_evaluate_chunk, *work_unit))
+        _collect_partials(pending, partials)
+
+    results = {}
+    for key, chunks in partials.items():
+        chunks.sort(key=lambda chunk: chunk[0])
+        count = sum(chunk[1] for chunk in chunks)
+        results[key] = tuple(math.fsum(chunk[2][strategy] for chunk in chunks) / count for strategy in range(3))
+    return results
+
+
+def _collect_partials(futures, partials):
+    for future in futures:
+        model_name, distribution_key, start, count, sums = future.result()
+        partials.setdefault((model_name, distribution_key), []).append((start, count, sums))
@@ -0,0 +1,68 @@
+import numpy as np
+
+from reachability import num_words, unpack_bits
+
+
+class FaultSignatureTable:
+    '''
+    Lookup table from a part failure to the pattern of observables it breaks.
+
+    The signature of part n is a packed bitmask over observable_indices (bit k set when observable k
+    fails if part n fails). The reverse index maps every signature to the parts producing it, so the
+    root causes of a complete observation are a single hash lookup. With every observable observed,
+    find_potential_root_causes_from_observerables returns exactly the interactable parts whose
+    signature equals the observed failures.
+    '''
+    def __init__(self, reachability_index, observable_indices):
+        self.index = reachability_index
+        self.compiled = reachability_index.compiled
+        self.observable_indices = np.asarray(observable_indices, dtype=np.int64)
+        self.num_observables = len(self.observable_indices)
+        self.num_words = num_words(self.num_observables)
+
+        # part n breaks observable k exactly when n is an ancestor of observable k
+        breaks = self.index.ancestor_matrix(self.observable_indices).T
+        packed = np.zeros((self.compiled.num_parts, self.num_words * 8), dtype=np.uint8)
+        packed_bytes = np.packbits(breaks, axis=1, bitorder='little')
+        packed[:, :packed_bytes.shape[1]] = packed_bytes
+        self.signatures = packed.view(np.uint64)
+
+        # parts grouped by signature, each class holds part indices in ascending order
+        self.signature_of_part = [row.tobytes() for row in self.signatures]
+        class_ids = {}
+        self.class_of_part = np.array([class_ids.setdefault(signature, len(class_ids))
+                                       for signature in self.signature_of_part], dtype=np.int64)
+        self.num_classes = len(class_ids)
+        class_members = np.split(np.argsort(self.class_of_part, kind='stable'),
+                                 np.cumsum(np.bincount(self.class_of_part, minlength=self.num_classes))[:-1])
+        self.parts_by_signature = dict(zip(class_ids, class_members))
+
+        self.is_interactable = unpack_bits(self.index.interactable_words, self.compiled.num_parts)
+        self.interactable_by_signature = {signature: parts[self.is_interactable[parts]]
+                                          for signature, parts in self.parts_by_signature.items()}
+        # size of the blanket (interactable parts) of every class
+        self.class_sizes = np.bincount(self.class_of_part[self.is_interactable], minlength=self.num_classes)
+
+    def signature_key(self, failing_observable_mask):
+        '''hash key of the signature whose failing observables are given by a bool mask over observable_indices'''
+        packed = np.zeros(self.num_words * 8, dtype=np.uint8)
+        packed_bytes = np.packbits(np.asarray(failing_observable_mask, dtype=bool), bitorder='little')
+        packed[:packed_bytes.size] = packed_bytes
+        return packed.tobytes()
+
+    def failing_observables(self, part_idx):
+        '''returns the indices (into observable_indices) of the observables broken by part part_idx'''
+        return np.flatnonzero(unpack_bits(self.signatures[part_idx], self.num_observables))
+
+    def root_causes(self, failing_observable_mask):
+        '''interactable part indices whose failure produces exactly the given failing observables'''
+        empty = np.empty(0, dtype=np.int64)
+        return self.interactable_by_signature.get(self.signature_key(failing_observable_mask), empty)
+
+    def blanket(self, part_idx):
+        '''interactable part indices indistinguishable from part_idx by the observables'''
+        return self.interactable_by_signature[self.signature_of_part[part_idx]]
+
+    def signature_classes(self):
+        '''returns the interactable part indices of every signature class which has any'''
+        return [parts for parts in self.interactable_by_signature.values() if parts.size]
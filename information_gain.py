@@ -0,0 +1,197 @@
+import itertools
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+import instrumentation
+from instrumentation import instrumented
+from reachability import pack_bits, unpack_bits
+
+CHECK_OBSERVABLE = 'observable'
+CHECK_PART = 'part'
+
+_EPSILON = 1e-12
+
+
+def _binary_entropy(p):
+    p = np.clip(p, 0.0, 1.0)
+    entropy = np.zeros_like(p)
+    inside = (p > 0) & (p < 1)
+    q = p[inside]
+    entropy[inside] = -(q * np.log2(q) + (1 - q) * np.log2(1 - q))
+    return entropy
+
+
+class InformationGainPlanner:
+    '''
+    Adaptive test sequencing: the next check is the one with the largest expected entropy reduction
+    of the single fault distribution (failure_prob over the remaining candidates) per instruction.
+
+    A check either reads an observable (fails when the fault is one of its ancestors) or checks an
+    interactable part directly (positive when it is the fault); the outcome is fully determined by the
+    fault, so the expected entropy reduction of a check is the binary entropy of its outcome.
+    Checking a part costs one instruction and reading an observable costs observation_cost. With
+    observation_cost=0 the observables are read first for free, which reproduces E[M_cf].
+    The candidate set is a packed bitmap updated with the reachability rows of each observation.
+    '''
+    def __init__(self, causal_model, observation_cost=1.0):
+        index = causal_model._reachability if causal_model._reachability is not None \
+            else causal_model.build_reachability_index()
+        self.index = index
+        self.compiled = index.compiled
+        self.num_parts = index.num_parts
+        self.observation_cost = observation_cost
+        self.observable_indices = self.compiled.get_indices(causal_model.observable_parts)
+        self.observable_ancestors = index.ancestor_matrix(self.observable_indices).astype(np.float64)
+        self.interactable = unpack_bits(index.interactable_words, self.num_parts)
+        self.failure_prob = causal_model.get_failure_rate_array()
+
+    def prior(self, failure_prob=None):
+        '''normalized fault distribution over interactable parts, uniform when no rates are set'''
+        if failure_prob is None:
+            failure_prob = self.failure_prob
+        weights = np.where(self.interactable, np.nan_to_num(np.asarray(failure_prob, dtype=np.float64)), 0.0)
+        if not weights.sum() > 0:
+            weights = self.interactable.astype(np.float64)
+        return weights / weights.sum()
+
+    def candidate_words(self, part_ids_working=(), part_ids_not_working=(), part_ids_checked=()):
+        '''packed candidate set consistent with the observations and the parts already checked negative'''
+        candidates = self.index.root_cause_candidate_words(self.compiled.get_indices(part_ids_working),
+                                                           self.compiled.get_indices(part_ids_not_working))
+        checked = np.zeros(self.num_parts, dtype=bool)
+        checked[self.compiled.get_indices(part_ids_checked)] = True
+        return candidates & ~pack_bits(checked)
+
+    def select_check(self, candidates, prior):
+        '''
+        returns (CHECK_OBSERVABLE or CHECK_PART, part index) of the best next check for a packed candidate set,
+        or None when no candidate has any probability left
+        '''
+        weights = unpack_bits(candidates, self.num_parts) * prior
+        total = weights.sum()
+        if not total > 0:
+            return None
+
+        part_information = _binary_entropy(weights / total)
+        # H(p) = H(1 - p), among equally informative parts the more likely one is checked first
+        best_part = int(np.argmax(np.where(part_information >= part_information.max() - _EPSILON, weights, -1.0)))
+        if part_information[best_part] <= _EPSILON:
+            # no uncertainty left, check the remaining candidate
+            return CHECK_PART, best_part
+
+        if self.observable_indices.size:
+            observable_information = _binary_entropy(self.observable_ancestors @ weights / total)
+            best_observable = int(np.argmax(observable_information))
+            if self.observation_cost > 0:
+                observable_score = observable_information[best_observable] / self.observation_cost
+            else:
+                observable_score = np.inf if observable_information[best_observable] > _EPSILON else -np.inf
+            # on a tie the part check wins, it can end the diagnosis
+            if observable_score > part_information[best_part] + _EPSILON:
+                return CHECK_OBSERVABLE, int(self.observable_indices[best_observable])
+        return CHECK_PART, best_part
+
+    def apply_check(self, candidates, check, outcome):
+        '''candidate set after a check; outcome is True for a failing observable or a positive part check'''
+        kind, idx = check
+        if kind == CHECK_OBSERVABLE:
+            row = self.index.ancestor_row(idx)
+            return candidates & row if outcome else candidates & ~row
+        if outcome:
+            return pack_bits(np.arange(self.num_parts) == idx)
+        candidates = candidates.copy()
+        candidates[idx >> 6] &= ~(np.uint64(1) << np.uint64(idx & 63))
+        return candidates
+
+    def next_check(self, part_ids_working=(), part_ids_not_working=(), part_ids_checked=()):
+        '''(CHECK_OBSERVABLE or CHECK_PART, part id) to check next given what is known so far'''
+        check = self.select_check(self.candidate_words(part_ids_working, part_ids_not_working, part_ids_checked),
+                                  self.prior())
+        if check is None:
+            return None
+        return check[0], self.compiled.part_ids[check[1]]
+
+    @instrumented()
+    def plan(self, broken_part_id, failure_prob=None):
+        '''the sequence of (check kind, part id, outcome) the planner performs when broken_part_id is the fault'''
+        prior = self.prior(failure_prob)
+        broken_idx = self.compiled.get_index(broken_part_id)
+        candidates = self.index.interactable_words.copy()
+        checks = []
+        while True:
+            check = self.select_check(candidates, prior)
+            if check is None:
+                instrumentation.visit(len(checks))
+                return checks
+            kind, idx = check
+            if kind == CHECK_OBSERVABLE:
+                outcome = bool(self.index.ancestor_row(idx)[broken_idx >> 6] >> np.uint64(broken_idx & 63) & np.uint64(1))
+            else:
+                outcome = idx == broken_idx
+            checks.append((kind, self.compiled.part_ids[idx], outcome))
+            if kind == CHECK_PART and outcome:
+                instrumentation.visit(len(checks))
+                return checks
+            candidates = self.apply_check(candidates, check, outcome)
+
+    @instrumented()
+    def expected_instructions(self, failure_prob=None):
+        '''
+        E[M_ig], the expected number of instructions until the faulty part is checked.
+        The decision tree of the greedy policy is expanded once; every fault follows one path through it.
+        '''
+        prior = self.prior(failure_prob)
+        expected_value = 0.0
+        num_nodes = 0
+        stack = [(self.index.interactable_words.copy(), 0.0)]
+        while stack:
+            candidates, cost = stack.pop()
+            num_nodes += 1
+            check = self.select_check(candidates, prior)
+            if check is None:
+                continue
+            kind, idx = check
+            if kind == CHECK_PART:
+                expected_value += prior[idx] * (cost + 1)
+                stack.append((self.apply_check(candidates, check, False), cost + 1))
+            else:
+                for outcome in (True, False):
+                    stack.append((self.apply_check(candidates, check, outcome), cost + self.observation_cost))
+        # decision tree nodes expanded
+        instrumentation.visit(num_nodes)
+        return expected_value
+
+    def average_expected_instructions(self, distribution, num_samples=1000, rng=None, confidence=0.95,
+                                      max_permutations=1000):
+        '''
+        E[M_ig] averaged over the assignments of distribution to the interactable parts, like the other
+        strategies in instruction_efficiency. Every assignment needs its own decision tree, so all
+        permutations are only enumerated while there are at most max_permutations of them; otherwise
+        num_samples random ones are averaged (num_samples=None forces the enumeration).
+        Returns (mean, half_width): the true average lies in mean +- half_width with the given confidence
+        (normal approximation), half_width is 0 for an enumeration.
+        '''
+        interactable_indices = np.flatnonzero(self.interactable)
+        distribution = np.asarray(distribution, dtype=np.float64)
+        exhaustive = num_samples is None or math.factorial(interactable_indices.size) <= max_permutations
+        if exhaustive:
+            assignments = itertools.permutations(interactable_indices)
+        else:
+            if rng is None:
+                rng = np.random.default_rng()
+            assignments = (rng.permutation(interactable_indices) for _ in range(num_samples))
+
+        samples = []
+        failure_prob = np.zeros(self.num_parts)
+        for assignment in assignments:
+            failure_prob[list(assignment)] = distribution
+            samples.append(self.expected_instructions(failure_prob))
+        mean = math.fsum(samples) / len(samples)
+        if exhaustive:
+            return mean, 0.0
+        if len(samples) < 2:
+            return mean, math.inf
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        return mean, z * float(np.std(samples, ddof=1)) / math.sqrt(len(samples))
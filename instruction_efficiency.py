@@ -1,20 +1,29 @@
+'''
+Instruction efficiency experiments: expected number of parts checked by the causal (c), frequency (f),
+combined (cf) and information gain (ig) strategies on the example circuits.
+
+  python instruction_efficiency.py [--no-plot] [--output-dir DIR]
+
+Importing the module has no side effects. matplotlib is only imported by plot_PMF, and the
+compute_expected_value_* helpers take any DataFrame-like input without importing pandas.
+'''
+import argparse
+import os
+
 from causal_graph_structure import CausalModel, CausalPart
-import pandas as pd
+from expected_instructions import (compute_expected_values_batch, expected_value_causal, expected_value_combined,
+                                   expected_value_frequency)
+import instrumentation
+from instrumentation import instrumented
 import numpy as np
 import random
-import itertools
-from matplotlib import pyplot as plt
-from matplotlib.ticker import MaxNLocator
 
+@instrumented()
 def compute_expected_value_frequency(failure_rates):
     '''E[M_f] = sum_{n=1}^{N}(P(p_{n-1})*n), where p_n are part falure rates sorted by frequency, and N is interactable parts'''
-    failure_rates.sort(reverse=True)
-    expected_instructions = 0
-    for n_instructions, rate_of_failure in enumerate(failure_rates):
-        expected_instructions += rate_of_failure * (n_instructions+1)
-    
-    return expected_instructions
+    return expected_value_frequency(failure_rates)
 
+@instrumented()
 def compute_expected_value_causal(causal_model, part_frequencies_df):
     '''
     E[M_c] = sum(E[Mb|p_n] * P(p_n))
@@ -25,22 +34,11 @@ def compute_expected_value_causal(causal_model, part_frequencies_df):
     P(p_n) - chance that p_n is the failed part
     
     '''
+    signatures = causal_model.get_fault_signature_table()
+    part_indices = signatures.compiled.get_indices(part_frequencies_df['part ids'])
+    return expected_value_causal(signatures, part_indices, part_frequencies_df['failure rates'].to_numpy())
 
-    expected_value_total = 0
-    for idx, row in part_frequencies_df.iterrows():
-        part_id = row['part ids']
-        #find observables for a given part failure
-        obs_working, obs_failing = causal_model.find_observables_from_failure(part_id)
-        markov_blanket = causal_model.find_potential_root_causes_from_observerables(obs_working, obs_failing)
-        num_parts = len(markov_blanket)
-        expected_value_blanket = (num_parts + 1)/2
-        expected_value_total += expected_value_blanket * row['failure rates']
-
-
-
-        pass
-    return expected_value_total
-
+@instrumented()
 def compute_expected_value_combined(causal_model, part_frequencies_df):
     '''
     E[M_c] = sum(E[Mb|p_n] * P(p_n))
@@ -50,30 +48,12 @@ def compute_expected_value_combined(causal_model, part_frequencies_df):
     P(p_n) - chance that p_n is the failed part
     
     '''
-
-    expected_value_total = 0
-    for idx, row in part_frequencies_df.iterrows():
-        part_id = row['part ids']
-        #find observables for a given part failure
-        obs_working, obs_failing = causal_model.find_observables_from_failure(part_id)
-        markov_blanket = causal_model.find_potential_root_causes_from_observerables(obs_working, obs_failing)
-        part_failure_rates_raw = causal_model.get_part_failure_rates(markov_blanket)
-        part_failure_rates = (part_failure_rates_raw / np.sum(part_failure_rates_raw)).tolist()
-        expected_value_blanket = compute_expected_value_frequency(part_failure_rates)
-        # expected_value_blanket will be nan when there is a 0% chance of that part broken
-        if not expected_value_blanket > 0:
-            expected_value_blanket = 0
-
-        expected_value_total += expected_value_blanket * row['failure rates']
-        # {'part ids': causal_model.get_interactable_part_ids(), 
-        #                    'failure rates': causal_model.get_part_failure_rates(causal_model.get_interactable_part_ids())}
-        # num_parts = len(markov_blanket)
-
-        # expected_value_blanket = (num_parts + 1)/2
-
-        # expected_value_total += expected_value_blanket * row['failure rates']
-    
-    return expected_value_total
+    signatures = causal_model.get_fault_signature_table()
+    part_indices = signatures.compiled.get_indices(part_frequencies_df['part ids'])
+    # the blankets use the failure rates currently set on the model
+    failure_prob = causal_model.get_failure_rate_array()
+    return expected_value_combined(signatures, part_indices, part_frequencies_df['failure rates'].to_numpy(),
+                                   failure_prob)
 
 
 def create_distrobution_truncated_geometric(N, r):
@@ -100,7 +80,21 @@ def create_distrobution_step(N, cutoff):
             probs.append(0.0)
     return probs
 
+def create_distrobution_grid_truncated_geometric(N, r_values):
+    '''one truncated geometric distribution per r in r_values, as a len(r_values) x N matrix'''
+    r_values = np.asarray(r_values, dtype=np.float64)[:, None]
+    probs = np.pow((1 - r_values), np.arange(N)) * r_values
+    return probs / np.sum(probs, axis=1, keepdims=True)
+
+def create_distrobution_grid_step(N, cutoffs):
+    '''one step distribution per cutoff in cutoffs, as a len(cutoffs) x N matrix'''
+    cutoffs = np.asarray(cutoffs)[:, None]
+    return (np.arange(N) < cutoffs) / cutoffs
+
 def plot_PMF(distro, title, filename):
+    from matplotlib import pyplot as plt
+    from matplotlib.ticker import MaxNLocator
+
     values = list(range(len(distro)))
     ax = plt.figure(figsize=(8,6)).gca()
     ax.plot(values, distro,'bo',ms=15)
@@ -116,108 +110,92 @@ def plot_PMF(distro, title, filename):
     # plt.show()
 
 
-cm = CausalModel()
-cm.add_part_full('R1', [], ['i1'])
-cm.add_part_full('R2', [], ['i2'])
-cm.add_part_full('R3', [], ['i3'])
-cm.add_part_full('L1', ['i1'], ['i1'])
-cm.add_part_full('L2', ['i2'], ['i2'])
-cm.add_part_full('L3', ['i3'], ['i3'])
-cm.add_part_full('i1', ['L1', 'R1'], ['L1'])
-cm.add_part_full('i2', ['L2', 'R2'], ['L2'])
-cm.add_part_full('i3', ['L3'], ['i1', 'i2', 'L3'])
-cm.set_observable_parts(['L1', 'L2', 'L3'])
-cm.set_non_interactable_parts(['i1', 'i2', 'i3'])
-
-# frequecies = np.array(range(1,6))
-# frequecies = [1, 1, 1, 1, 1]
-# frequecies = [0.9, 0.025, 0.025, 0.025, 0.025]
-# frequecies = frequecies / np.sum(frequecies)
-# frequecies = frequecies.tolist()
-# random.shuffle(frequecies)
-
-probs_geometric = create_distrobution_truncated_geometric(6, 0.75)
-probs_step = create_distrobution_step(6, 3)
-probs_uniform = create_distrobution_uniform(6)
-plot_PMF(probs_geometric, 'Geometric Distribution (r = 0.75)', 'geometric_distribution.pdf')
-plot_PMF(probs_step, 'Step Distribution (N_c = 3)', 'step_distribution.pdf')
-plot_PMF(probs_uniform, 'Uniform Distribution', 'uniform_distribution.pdf')
-
-distros_all = [probs_geometric, probs_step, probs_uniform]
-part_permutes = list(itertools.permutations(cm.get_interactable_part_ids()))
-
-for distrobution in distros_all:
-    expected_value_c = 0
-    expected_value_f = 0
-    expected_value_cf = 0
-    for parts_list in part_permutes:
-        cm.set_part_failure_rates(parts_list, distrobution)
-        cm_part_failure_rates = {'part ids': cm.get_interactable_part_ids(), 
-                            'failure rates': cm.get_part_failure_rates(cm.get_interactable_part_ids())}
-
-        cm_part_failure_rates_df = pd.DataFrame(data=cm_part_failure_rates)
-        cm_part_failure_rates_df = cm_part_failure_rates_df.sort_values(by=['failure rates'])
-
-        expected_value_f += compute_expected_value_frequency(cm_part_failure_rates_df['failure rates'].tolist())
-        expected_value_c += compute_expected_value_causal(cm, cm_part_failure_rates_df)
-        expected_value_cf += compute_expected_value_combined(cm, cm_part_failure_rates_df)
-    expected_value_c /= len(part_permutes)
-    expected_value_f /= len(part_permutes)
-    expected_value_cf /= len(part_permutes)
-    print('c: ', expected_value_c)
-    print('f: ', expected_value_f)
-    print('cf: ', expected_value_cf)
-
-# 6 part circuit
-cm = CausalModel()
-cm.add_part_full('R1', [], ['i1'])
-cm.add_part_full('R2', [], ['i2'])
-cm.add_part_full('R3', [], ['i3'])
-cm.add_part_full('L1', ['i1'], ['i1'])
-cm.add_part_full('L2', ['i2'], ['i2'])
-cm.add_part_full('L3', ['i2'], ['i2'])
-cm.add_part_full('i1', ['L1', 'R1'], ['L1'])
-cm.add_part_full('i2', ['L2', 'L3', 'R2'], ['L2', 'L3'])
-cm.add_part_full('i3', [], ['i1', 'i2'])
-cm.set_observable_parts(['L1', 'L2', 'L3']) 
-cm.set_non_interactable_parts(['i1', 'i2', 'i3'])
-
-
-# frequecies = [0.7, 0.035, 0.035, 0.035, 0.035, 0.035]
-# frequecies = frequecies / np.sum(frequecies)
-# frequecies = frequecies.tolist()
-# random.shuffle(frequecies)
-
-probs_geometric = create_distrobution_truncated_geometric(6, 0.75)
-probs_step = create_distrobution_step(6, 3)
-print(np.sum(probs_step))
-probs_uniform = create_distrobution_uniform(6)
-
-distros_all = [probs_geometric, probs_step, probs_uniform]
-part_permutes = list(itertools.permutations(cm.get_interactable_part_ids()))
-
-for distrobution in distros_all:
-    expected_value_c = 0
-    expected_value_f = 0
-    expected_value_cf = 0
-    for parts_list in part_permutes:
-        cm.set_part_failure_rates(parts_list, distrobution)
-        cm_part_failure_rates = {'part ids': cm.get_interactable_part_ids(), 
-                            'failure rates': cm.get_part_failure_rates(cm.get_interactable_part_ids())}
-
-        cm_part_failure_rates_df = pd.DataFrame(data=cm_part_failure_rates)
-        cm_part_failure_rates_df = cm_part_failure_rates_df.sort_values(by=['failure rates'])
-
-        expected_value_f += compute_expected_value_frequency(cm_part_failure_rates_df['failure rates'].tolist())
-        expected_value_c += compute_expected_value_causal(cm, cm_part_failure_rates_df)
-        expected_value_cf += compute_expected_value_combined(cm, cm_part_failure_rates_df)
-    expected_value_c /= len(part_permutes)
-    expected_value_f /= len(part_permutes)
-    expected_value_cf /= len(part_permutes)
-    print('c: ', expected_value_c)
-    print('f: ', expected_value_f)
-    print('cf: ', expected_value_cf)
-    
+def build_circuit_1():
+    cm = CausalModel()
+    cm.add_part_full('R1', [], ['i1'])
+    cm.add_part_full('R2', [], ['i2'])
+    cm.add_part_full('R3', [], ['i3'])
+    cm.add_part_full('L1', ['i1'], ['i1'])
+    cm.add_part_full('L2', ['i2'], ['i2'])
+    cm.add_part_full('L3', ['i3'], ['i3'])
+    cm.add_part_full('i1', ['L1', 'R1'], ['L1'])
+    cm.add_part_full('i2', ['L2', 'R2'], ['L2'])
+    cm.add_part_full('i3', ['L3'], ['i1', 'i2', 'L3'])
+    cm.set_observable_parts(['L1', 'L2', 'L3'])
+    cm.set_non_interactable_parts(['i1', 'i2', 'i3'])
+    return cm
+
+def build_circuit_2():
+    # 6 part circuit
+    cm = CausalModel()
+    cm.add_part_full('R1', [], ['i1'])
+    cm.add_part_full('R2', [], ['i2'])
+    cm.add_part_full('R3', [], ['i3'])
+    cm.add_part_full('L1', ['i1'], ['i1'])
+    cm.add_part_full('L2', ['i2'], ['i2'])
+    cm.add_part_full('L3', ['i2'], ['i2'])
+    cm.add_part_full('i1', ['L1', 'R1'], ['L1'])
+    cm.add_part_full('i2', ['L2', 'L3', 'R2'], ['L2', 'L3'])
+    cm.add_part_full('i3', [], ['i1', 'i2'])
+    cm.set_observable_parts(['L1', 'L2', 'L3'])
+    cm.set_non_interactable_parts(['i1', 'i2', 'i3'])
+    return cm
+
+def print_expected_values(cm, distros_all):
+    # average over every assignment of each distribution to the interactable parts, in closed form
+    expected_values_f, expected_values_c, expected_values_cf = compute_expected_values_batch(cm, distros_all)
+    # adaptive information gain sequencing, reading an observable costs one instruction like checking a part
+    planner = cm.get_information_gain_planner()
+    for distro, expected_value_f, expected_value_c, expected_value_cf in zip(distros_all, expected_values_f, expected_values_c, expected_values_cf):
+        print('c: ', expected_value_c)
+        print('f: ', expected_value_f)
+        print('cf: ', expected_value_cf)
+        expected_value_ig, half_width = planner.average_expected_instructions(distro)
+        print('ig: ', expected_value_ig, '+-', half_width)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Expected instruction counts of the troubleshooting strategies.')
+    parser.add_argument('--no-plot', action='store_true', help='do not write the distribution PMF PDFs')
+    parser.add_argument('--output-dir', default='.', help='directory for the PMF PDFs')
+    parser.add_argument('--profile', action='store_true', help='print call counts and times of the evaluators')
+    args = parser.parse_args(argv)
+    if args.profile:
+        instrumentation.enable()
+
+    # frequecies = np.array(range(1,6))
+    # frequecies = [1, 1, 1, 1, 1]
+    # frequecies = [0.9, 0.025, 0.025, 0.025, 0.025]
+    # frequecies = frequecies / np.sum(frequecies)
+    # frequecies = frequecies.tolist()
+    # random.shuffle(frequecies)
+
+    probs_geometric = create_distrobution_truncated_geometric(6, 0.75)
+    probs_step = create_distrobution_step(6, 3)
+    probs_uniform = create_distrobution_uniform(6)
+    if not args.no_plot:
+        plot_PMF(probs_geometric, 'Geometric Distribution (r = 0.75)', os.path.join(args.output_dir, 'geometric_distribution.pdf'))
+        plot_PMF(probs_step, 'Step Distribution (N_c = 3)', os.path.join(args.output_dir, 'step_distribution.pdf'))
+        plot_PMF(probs_uniform, 'Uniform Distribution', os.path.join(args.output_dir, 'uniform_distribution.pdf'))
+
+    distros_all = [probs_geometric, probs_step, probs_uniform]
+    print_expected_values(build_circuit_1(), distros_all)
+
+    # frequecies = [0.7, 0.035, 0.035, 0.035, 0.035, 0.035]
+    # frequecies = frequecies / np.sum(frequecies)
+    # frequecies = frequecies.tolist()
+    # random.shuffle(frequecies)
+
+    probs_geometric = create_distrobution_truncated_geometric(6, 0.75)
+    probs_step = create_distrobution_step(6, 3)
+    print(np.sum(probs_step))
+    probs_uniform = create_distrobution_uniform(6)
+
+    distros_all = [probs_geometric, probs_step, probs_uniform]
+    print_expected_values(build_circuit_2(), distros_all)
+
+    if args.profile:
+        print(instrumentation.format_stats())
+
 
 # circuit4_cm[0, 6] = 1 # R1 -> i1s
 # circuit4_cm[1, 7] = 1 # R2 -> i2
@@ -233,3 +211,7 @@ for distrobution in distros_all:
 
 
 # print(cm_1.get_part_failure_rates(['R1', 'L2']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+'''
+Compact binary file format for compiled causal models.
+
+All values are little-endian and every section starts on an 8 byte boundary:
+  header          magic b'CAUSALM1', then uint64 version, num_parts, num_edges, id_kind, id_blob_size,
+                  num_observables (version 2)
+  id table        id_kind 0: int64 part ids
+                  id_kind 1: int64 byte offsets (num_parts + 1) into a utf-8 blob of string part ids
+  fwd_indptr      int64 (num_parts + 1)
+  fwd_indices     int32 (num_edges)
+  rev_indptr      int64 (num_parts + 1)
+  rev_indices     int32 (num_edges)
+  is_observable   bool (num_parts)
+  is_interactable bool (num_parts)
+  failure_prob    float64 (num_parts)
+  observable_order int64 (num_observables), indices of the observable parts in the order of the
+                  model's observable_parts (version 2, version 1 files use the index order)
+
+load_compiled_model maps the file with np.memmap and every array of the returned model is a
+read-only view into it, so any number of processes loading the same file share one copy through
+the page cache and the load itself does no per-part work.
+'''
+from collections.abc import Sequence
+
+import numpy as np
+
+from compiled_causal_model import CompiledCausalModel
+
+MAGIC = b'CAUSALM1'
+VERSION = 2
+HEADER_FIELDS = [('magic', 'S8'), ('version', '<u8'), ('num_parts', '<u8'), ('num_edges', '<u8'),
+                 ('id_kind', '<u8'), ('id_blob_size', '<u8')]
+# header of every readable version, version 1 files have no observable order
+HEADER_DTYPES = {1: np.dtype(HEADER_FIELDS), 2: np.dtype(HEADER_FIELDS + [('num_observables', '<u8')])}
+HEADER_DTYPE = HEADER_DTYPES[VERSION]
+ID_KIND_INT = 0
+ID_KIND_STR = 1
+
+
+class PartIdTable(Sequence):
+    '''read-only sequence of part ids backed by the id table of a model file, decoded on access'''
+    def __init__(self, id_kind, values, blob=None):
+        self.id_kind = id_kind
+        self.values = values # int ids, or byte offsets into blob for string ids
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.values) - 1 if self.id_kind == ID_KIND_STR else len(self.values)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if self.id_kind == ID_KIND_INT:
+            return int(self.values[idx])
+        if idx < 0:
+            idx += len(self)
+        return bytes(self.blob[self.values[idx]:self.values[idx + 1]]).decode('utf-8')
+
+
+def _aligned(num_bytes):
+    return (num_bytes + 7) // 8 * 8
+
+
+def _sections(num_parts, num_edges, id_kind, id_blob_size, num_observables=None):
+    '''(name, dtype, count) of every section after the header, in file order; num_observables None is version 1'''
+    if id_kind == ID_KIND_INT:
+        id_sections = [('ids', '<i8', num_parts)]
+    else:
+        id_sections = [('id_offsets', '<i8', num_parts + 1), ('id_blob', 'u1', id_blob_size)]
+    sections = id_sections + [
+        ('fwd_indptr', '<i8', num_parts + 1),
+        ('fwd_indices', '<i4', num_edges),
+        ('rev_indptr', '<i8', num_parts + 1),
+        ('rev_indices', '<i4', num_edges),
+        ('is_observable', '?', num_parts),
+        ('is_interactable', '?', num_parts),
+        ('failure_prob', '<f8', num_parts),
+    ]
+    if num_observables is not None:
+        sections.append(('observable_order', '<i8', num_observables))
+    return sections
+
+
+def save_compiled_model(compiled, path):
+    '''writes a CompiledCausalModel to path in the model file format'''
+    part_ids = list(compiled.part_ids)
+    if all(isinstance(part_id, (int, np.integer)) for part_id in part_ids):
+        id_kind = ID_KIND_INT
+        id_arrays = [np.array(part_ids, dtype='<i8')]
+        id_blob_size = 0
+    elif all(isinstance(part_id, str) for part_id in part_ids):
+        id_kind = ID_KIND_STR
+        encoded = [part_id.encode('utf-8') for part_id in part_ids]
+        offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+        np.cumsum([len(part_id) for part_id in encoded], out=offsets[1:])
+        id_blob = np.frombuffer(b''.join(encoded), dtype='u1')
+        id_arrays = [offsets, id_blob]
+        id_blob_size = id_blob.size
+    else:
+        raise ValueError('part ids must be all int or all str to be saved')
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['num_parts'] = compiled.num_parts
+    header['num_edges'] = compiled.num_edges
+    header['id_kind'] = id_kind
+    header['id_blob_size'] = id_blob_size
+    observable_order = compiled.observable_indices()
+    header['num_observables'] = len(observable_order)
+
+    arrays = id_arrays + [compiled.fwd_indptr, compiled.fwd_indices, compiled.rev_indptr, compiled.rev_indices,
+                          compiled.is_observable, compiled.is_interactable, compiled.failure_prob, observable_order]
+    sections = _sections(compiled.num_parts, compiled.num_edges, id_kind, id_blob_size, len(observable_order))
+    with open(path, 'wb') as model_file:
+        model_file.write(header.tobytes())
+        for array, (_, dtype, count) in zip(arrays, sections):
+            data = np.ascontiguousarray(array, dtype=dtype).tobytes()
+            assert len(data) == np.dtype(dtype).itemsize * count
+            model_file.write(data)
+            model_file.write(b'\0' * (_aligned(len(data)) - len(data)))
+
+
+def load_compiled_model(path):
+    '''maps a model file written by save_compiled_model, returns a read-only CompiledCausalModel'''
+    data = np.memmap(path, dtype='u1', mode='r')
+    prefix = data[:HEADER_DTYPES[1].itemsize].view(HEADER_DTYPES[1])[0]
+    if prefix['magic'] != MAGIC or int(prefix['version']) not in HEADER_DTYPES:
+        raise ValueError(str(path) + ' is not a version 1 to ' + str(VERSION) + ' causal model file')
+    header_dtype = HEADER_DTYPES[int(prefix['version'])]
+    header = data[:header_dtype.itemsize].view(header_dtype)[0]
+    num_observables = int(header['num_observables']) if 'num_observables' in header_dtype.names else None
+
+    offset = _aligned(header_dtype.itemsize)
+    arrays = {}
+    for name, dtype, count in _sections(int(header['num_parts']), int(header['num_edges']),
+                                        int(header['id_kind']), int(header['id_blob_size']), num_observables):
+        num_bytes = np.dtype(dtype).itemsize * count
+        arrays[name] = data[offset:offset + num_bytes].view(dtype)
+        offset += _aligned(num_bytes)
+
+    if header['id_kind'] == ID_KIND_INT:
+        part_ids = PartIdTable(ID_KIND_INT, arrays['ids'])
+    else:
+        part_ids = PartIdTable(ID_KIND_STR, arrays['id_offsets'], arrays['id_blob'])
+    return CompiledCausalModel(part_ids, arrays['fwd_indptr'], arrays['fwd_indices'],
+                               arrays['rev_indptr'], arrays['rev_indices'], arrays['failure_prob'],
+                               arrays['is_observable'], arrays['is_interactable'], arrays.get('observable_order'))
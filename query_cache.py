@@ -0,0 +1,64 @@
+from collections import OrderedDict
+
+import instrumentation
+
+DEFAULT_MAXSIZE = 4096
+# about 8 MB of references on a 64 bit build
+DEFAULT_MAX_ELEMENTS = 1 << 20
+
+
+class QueryCache:
+    '''
+    Bounded LRU memo for CausalModel queries, stamped with the structure version of the model.
+
+    A lookup with a different version than the cached entries drops them all, so a structural
+    change invalidates the cache without the model tracking which queries it affects.
+    Entries are bounded in number by maxsize and in the total number of parts they reference by
+    max_elements, a closure on a large graph holds O(N) parts so the entry count alone does not
+    bound the memory. Least recently used entries are evicted until both bounds hold, a value larger
+    than max_elements on its own is returned without being stored.
+    maxsize=0 disables caching (every lookup is a miss and nothing is stored).
+    '''
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, max_elements=DEFAULT_MAX_ELEMENTS):
+        self.maxsize = maxsize
+        self.max_elements = max_elements
+        self.version = None
+        self.entries = OrderedDict() # key -> (value, number of elements)
+        self.num_elements = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key, compute, size=len):
+        '''
+        returns the cached value of key, or stores and returns compute();
+        size(value) is the number of elements the value holds, counted against max_elements
+        '''
+        if version != self.version:
+            self.entries.clear()
+            self.num_elements = 0
+            self.version = version
+        if key in self.entries:
+            self.hits += 1
+            instrumentation.cache_hit()
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+        self.misses += 1
+        value = compute()
+        num_elements = size(value)
+        if self.maxsize > 0 and num_elements <= self.max_elements:
+            self.entries[key] = (value, num_elements)
+            self.num_elements += num_elements
+            while len(self.entries) > self.maxsize or self.num_elements > self.max_elements:
+                self.num_elements -= self.entries.popitem(last=False)[1][1]
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.num_elements = 0
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize,
+                'elements': self.num_elements, 'max_elements': self.max_elements, 'version': self.version}
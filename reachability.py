@@ -0,0 +1,168 @@
+import numpy as np
+
+from compiled_causal_model import _sorted_unique
+from condensation import CondensedCausalModel
+
+WORD_BITS = 64
+
+# tri-state values of an observation matrix (reports x observables)
+OBSERVATION_UNKNOWN = -1
+OBSERVATION_WORKING = 0
+OBSERVATION_FAILING = 1
+
+
+def num_words(num_bits):
+    return (num_bits + WORD_BITS - 1) // WORD_BITS
+
+
+def pack_bits(mask):
+    '''packs a bool array into little-endian uint64 words (bit n of the set is bit n%64 of word n//64)'''
+    mask = np.asarray(mask, dtype=bool)
+    packed = np.packbits(mask, bitorder='little')
+    padded = np.zeros(num_words(mask.size) * 8, dtype=np.uint8)
+    padded[:packed.size] = packed
+    return padded.view(np.uint64)
+
+
+def unpack_bits(words, num_bits):
+    '''inverse of pack_bits, returns a bool array of length num_bits'''
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    return np.unpackbits(words.view(np.uint8), count=num_bits, bitorder='little').astype(bool)
+
+
+def bits_from_indices(indices, num_bits):
+    mask = np.zeros(num_bits, dtype=bool)
+    mask[np.asarray(indices, dtype=np.int64)] = True
+    return pack_bits(mask)
+
+
+def indices_from_bits(words, num_bits):
+    return np.flatnonzero(unpack_bits(words, num_bits))
+
+
+class ReachabilityIndex:
+    '''
+    Precomputed transitive closure of a CompiledCausalModel.
+
+    Every part has one packed bitset row of its ancestors (parts which can cause it to fail) and one
+    of its descendants (parts it causes to fail), both including the part itself. Rows are stored
+    once per strongly connected component (all parts of a component share their closure) and are
+    built in a single pass over the condensed DAG, so memory is O(components * parts / 64) words.
+    '''
+    def __init__(self, compiled):
+        self.compiled = compiled
+        self.num_parts = compiled.num_parts
+        self.num_words = num_words(self.num_parts)
+
+        condensed = CondensedCausalModel(compiled)
+        self.condensed = condensed
+        self.labels = condensed.labels
+        self.num_components = condensed.num_components
+
+        # rows start out holding the members of each component
+        part_indices = np.arange(self.num_parts, dtype=np.uint64)
+        members = np.zeros((self.num_components, self.num_words), dtype=np.uint64)
+        np.bitwise_or.at(members, (self.labels, (part_indices >> np.uint64(6)).astype(np.int64)),
+                         np.left_shift(np.uint64(1), part_indices & np.uint64(63)))
+
+        fwd_indptr, fwd_indices = condensed.fwd_indptr, condensed.fwd_indices
+        rev_indptr, rev_indices = condensed.rev_indptr, condensed.rev_indices
+
+        # successors always have smaller labels, so ascending order visits them first
+        self.descendant_rows = members.copy()
+        for component in range(self.num_components):
+            successors = fwd_indices[fwd_indptr[component]:fwd_indptr[component + 1]]
+            if successors.size:
+                self.descendant_rows[component] |= np.bitwise_or.reduce(self.descendant_rows[successors], axis=0)
+
+        self.ancestor_rows = members
+        for component in range(self.num_components - 1, -1, -1):
+            predecessors = rev_indices[rev_indptr[component]:rev_indptr[component + 1]]
+            if predecessors.size:
+                self.ancestor_rows[component] |= np.bitwise_or.reduce(self.ancestor_rows[predecessors], axis=0)
+
+        self.interactable_words = pack_bits(compiled.is_interactable)
+
+    def ancestor_row(self, idx):
+        return self.ancestor_rows[self.labels[idx]]
+
+    def descendant_row(self, idx):
+        return self.descendant_rows[self.labels[idx]]
+
+    def ancestors(self, idx):
+        return indices_from_bits(self.ancestor_row(idx), self.num_parts)
+
+    def descendants(self, idx):
+        return indices_from_bits(self.descendant_row(idx), self.num_parts)
+
+    def set_interactable(self, indices, is_interactable):
+        mask = unpack_bits(self.interactable_words, self.num_parts)
+        mask[np.asarray(indices, dtype=np.int64)] = is_interactable
+        self.interactable_words = pack_bits(mask)
+
+    def root_cause_candidate_words(self, working_indices, failing_indices):
+        '''
+        Packed set of interactable parts which are an ancestor of every failing part
+        and of no working part (see CausalModel.find_potential_root_causes_from_observerables).
+        '''
+        candidates = self.interactable_words.copy()
+        failing_indices = np.asarray(failing_indices, dtype=np.int64)
+        working_indices = np.asarray(working_indices, dtype=np.int64)
+        if failing_indices.size:
+            candidates &= np.bitwise_and.reduce(self.ancestor_rows[self.labels[failing_indices]], axis=0)
+        if working_indices.size:
+            candidates &= ~np.bitwise_or.reduce(self.ancestor_rows[self.labels[working_indices]], axis=0)
+        return candidates
+
+    def root_cause_candidates(self, working_indices, failing_indices):
+        return indices_from_bits(self.root_cause_candidate_words(working_indices, failing_indices), self.num_parts)
+
+    def ancestor_matrix(self, indices):
+        '''returns a bool matrix (len(indices) x parts) whose row k holds the ancestors of part indices[k]'''
+        rows = self.ancestor_rows[self.labels[np.asarray(indices, dtype=np.int64)]]
+        return np.unpackbits(rows.view(np.uint8), axis=1, count=self.num_parts, bitorder='little').astype(bool)
+
+    def root_cause_candidate_matrix(self, observable_indices, observations, chunk_size=1024):
+        '''
+        Batch version of root_cause_candidates.
+        Inputs:
+          observable_indices - O part indices, one per observation column
+          observations - R x O matrix of OBSERVATION_FAILING / OBSERVATION_WORKING / OBSERVATION_UNKNOWN
+          chunk_size - reports evaluated per matrix product, bounds memory to chunk_size x parts
+
+        Outputs:
+          candidates - R x N bool matrix, candidates[r, n] is True when part n is a potential root cause of report r
+        '''
+        observations = np.atleast_2d(np.asarray(observations))
+        # only interactable parts can be candidates, so only their columns take part in the product
+        columns = indices_from_bits(self.interactable_words, self.num_parts)
+        # a working observable outweighs every failing one, so one product scores both conditions
+        working_weight = observations.shape[1] + 1
+        # scores are integers, float32 only holds them exactly up to 2**24
+        dtype = np.float32 if working_weight * working_weight < 2 ** 24 else np.float64
+        ancestors = self.ancestor_matrix(observable_indices)[:, columns].astype(dtype)
+
+        candidates = np.zeros((observations.shape[0], self.num_parts), dtype=bool)
+        for start in range(0, observations.shape[0], chunk_size):
+            chunk = observations[start:start + chunk_size]
+            failing = chunk == OBSERVATION_FAILING
+            weights = failing.astype(dtype) - dtype(working_weight) * (chunk == OBSERVATION_WORKING)
+            # a candidate is an ancestor of every failing observable and of no working one
+            scores = weights @ ancestors
+            candidates[start:start + chunk_size, columns] = scores == failing.sum(axis=1, keepdims=True)
+        return candidates
+
+    def add_edge(self, source_idx, target_idx):
+        '''
+        Patches the index in place for a new edge source -> target between existing parts.
+        Every descendant of target gains the ancestors of source, and every ancestor of source
+        gains the descendants of target. A new cycle leaves the components unmerged, their rows
+        simply become equal.
+        '''
+        source_ancestors = self.ancestor_row(source_idx).copy()
+        target_descendants = self.descendant_row(target_idx).copy()
+
+        affected_descendants = _sorted_unique(self.labels[indices_from_bits(target_descendants, self.num_parts)])
+        affected_ancestors = _sorted_unique(self.labels[indices_from_bits(source_ancestors, self.num_parts)])
+        self.ancestor_rows[affected_descendants] |= source_ancestors
+        self.descendant_rows[affected_ancestors] |= target_descendants
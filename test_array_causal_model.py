@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from array_causal_model import ArrayCausalModel
+from conftest import build_random_model, random_reports
+
+
+def model_pair(seed):
+    causal_model = build_random_model(50, 70, seed, num_observable=7, num_non_interactable=8)
+    array_model = ArrayCausalModel(causal_model.compile())
+    array_model.set_query_cache_size(0)
+    return causal_model, array_model
+
+
+def part_ids(parts):
+    return {part.part_id for part in parts}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_queries_match_causal_model(seed):
+    causal_model, array_model = model_pair(seed)
+    assert array_model.observable_parts == causal_model.observable_parts
+    assert array_model.get_interactable_part_ids() == causal_model.get_interactable_part_ids()
+    assert np.array_equal(array_model.get_interactable_mask(), causal_model.get_interactable_mask())
+    for part in causal_model.parts:
+        part_id = part.part_id
+        assert (part_ids(array_model.find_all_causes_for_part(part_id, [])) ==
+                part_ids(causal_model.find_all_causes_for_part(part_id, [])))
+        assert (part_ids(array_model.find_failures_caused_by_part(part_id, [])) ==
+                part_ids(causal_model.find_failures_caused_by_part(part_id, [])))
+        working, failing = causal_model.find_observables_from_failure(part_id)
+        array_working, array_failing = array_model.find_observables_from_failure(part_id)
+        assert (set(array_working), set(array_failing)) == (set(working), set(failing))
+        array_part = array_model.get_part_from_id(part_id)
+        assert part_ids(array_part.causes) == part_ids(part.causes)
+        assert part_ids(array_part.caused_by) == part_ids(part.caused_by)
+    for working, failing in random_reports(causal_model, 30, seed):
+        assert (set(array_model.find_potential_root_causes_from_observerables(working, failing)) ==
+                set(causal_model.find_potential_root_causes_from_observerables(working, failing)))
+    assert array_model.get_part_from_id('missing') is False
+
+
+def test_failure_rate_setters_match_causal_model():
+    causal_model, array_model = model_pair(0)
+    interactable_ids = causal_model.get_interactable_part_ids()
+    rates = np.random.default_rng(0).random(len(interactable_ids)).tolist()
+    for model in (causal_model, array_model):
+        model.set_part_failure_rates(interactable_ids, rates)
+    assert array_model.get_part_failure_rates(interactable_ids) == causal_model.get_part_failure_rates(interactable_ids)
+    assert np.array_equal(array_model.get_failure_rate_array(), causal_model.get_failure_rate_array(),
+                          equal_nan=True)
+
+    mask = causal_model.get_interactable_mask()
+    for model in (causal_model, array_model):
+        model.set_failure_rate_array(np.arange(mask.sum()) / 10, mask)
+    assert np.array_equal(array_model.get_failure_rate_array(mask), causal_model.get_failure_rate_array(mask))
+    assert array_model.get_part_from_id(interactable_ids[3]).failure_prob == 0.3
+
+
+def test_structure_is_read_only():
+    causal_model, array_model = model_pair(1)
+    with pytest.raises(TypeError):
+        array_model.add_part_full('new', [], [])
+    part = next(part for part in causal_model.parts if part.causes)
+    cause_id = next(iter(part.causes)).part_id
+    # an edge which is already there is accepted, a new one is not
+    array_model.add_part_full(part.part_id, [], [cause_id])
+    missing_id = next(other.part_id for other in causal_model.parts if other not in part.causes)
+    with pytest.raises(TypeError):
+        array_model.add_part_full(part.part_id, [], [missing_id])
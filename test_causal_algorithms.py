@@ -0,0 +1,76 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+import causal_algorithms
+from causal_algorithms import (CausalPlanner, generate_plan_causal_fast, generate_plan_causal_fast_from_multiple_parts,
+                               generate_plan_causal_from_multiple_parts, generate_plan_causal_from_single_part)
+from compiled_causal_model import CompiledCausalModel
+
+CIRCUITS = ('circuit1_cm', 'circuit2_cm', 'circuit3_cm', 'circuit4_cm')
+
+
+def deque_plan(planner, broken_part):
+    '''plain deque BFS over the planner's shuffled neighbor lists, marking parts when they are queued'''
+    indptr = planner.indptr.tolist()
+    neighbors = planner.neighbors.tolist()
+    visited = {broken_part}
+    queue = deque([broken_part])
+    plan = []
+    while queue:
+        current_part = queue.popleft()
+        plan.append(current_part)
+        for next_part in neighbors[indptr[current_part]:indptr[current_part + 1]]:
+            if next_part not in visited:
+                visited.add(next_part)
+                queue.append(next_part)
+    return plan
+
+
+@pytest.mark.parametrize('circuit', CIRCUITS)
+def test_fast_plan_visits_the_original_parts_once(circuit):
+    causal_model = getattr(causal_algorithms, circuit)
+    for broken_part in range(causal_model.shape[0]):
+        plan = generate_plan_causal_fast(causal_model, broken_part, seed=1)
+        assert plan[0] == broken_part
+        assert len(plan) == len(set(plan))
+        assert set(plan) == set(generate_plan_causal_from_single_part(causal_model, broken_part))
+        assert plan == generate_plan_causal_fast(causal_model, broken_part, seed=1)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_planner_matches_deque_bfs(seed):
+    rng = np.random.default_rng(seed)
+    compiled = CompiledCausalModel.from_matrix((rng.integers(0, 2000, 6000), rng.integers(0, 2000, 6000)))
+    planner = CausalPlanner(compiled, seed=seed)
+    for broken_part in rng.integers(0, 2000, 20).tolist():
+        plan = planner.plan(broken_part)
+        assert plan.tolist() == deque_plan(planner, broken_part)
+        assert np.array_equal(np.sort(plan), np.sort(compiled.ancestors(broken_part)))
+
+
+@pytest.mark.parametrize('circuit', CIRCUITS)
+def test_fast_multiple_part_plan_filters_the_first_plan(circuit):
+    causal_model = getattr(causal_algorithms, circuit)
+    for broken_part in range(causal_model.shape[0]):
+        broken_parts = [broken_part, (broken_part + 3) % causal_model.shape[0]]
+        plan = generate_plan_causal_fast_from_multiple_parts(causal_model, broken_parts, seed=1)
+        second_causes = set(generate_plan_causal_from_single_part(causal_model, broken_parts[1]))
+        assert plan == [part for part in generate_plan_causal_fast(causal_model, broken_part, seed=1)
+                        if part in second_causes]
+        assert set(plan) == set(generate_plan_causal_from_multiple_parts(causal_model, broken_parts))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_plan_multiple_intersects_every_broken_part(seed):
+    rng = np.random.default_rng(seed)
+    compiled = CompiledCausalModel.from_matrix((rng.integers(0, 300, 600), rng.integers(0, 300, 600)))
+    planner = CausalPlanner(compiled, seed=seed)
+    for _ in range(20):
+        broken_parts = rng.integers(0, 300, int(rng.integers(1, 4))).tolist()
+        common = set(compiled.ancestors(broken_parts[0]).tolist())
+        for broken_part in broken_parts[1:]:
+            common &= set(compiled.ancestors(broken_part).tolist())
+        assert planner.plan_multiple(broken_parts).tolist() == [
+            part for part in planner.plan(broken_parts[0]).tolist() if part in common]
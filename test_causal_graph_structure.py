@@ -0,0 +1,18 @@
+from causal_graph_structure import CausalModel
+
+
+def test_neighbors_keep_insertion_order_without_duplicates():
+    causal_model = CausalModel()
+    causal_model.add_part_full('a', [], ['c', 'b', 'c'])
+    causal_model.add_part_full('b', ['a'], ['c'])
+    part = causal_model.get_part_from_id('a')
+    assert [cause.part_id for cause in part.causes] == ['c', 'b']
+    assert [cause.part_id for cause in causal_model.get_part_from_id('c').caused_by] == ['a', 'b']
+    assert causal_model.get_part_from_id('b') in part.causes
+
+    rebuilt = CausalModel()
+    rebuilt.init_from_compiled(causal_model.compile())
+    for part in causal_model.parts:
+        rebuilt_part = rebuilt.get_part_from_id(part.part_id)
+        assert [cause.part_id for cause in rebuilt_part.causes] == [cause.part_id for cause in part.causes]
+        assert [cause.part_id for cause in rebuilt_part.caused_by] == [cause.part_id for cause in part.caused_by]
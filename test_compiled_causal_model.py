@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from causal_graph_structure import CausalModel
+from compiled_causal_model import CompiledCausalModel
+from conftest import build_random_model, reference_closure
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_closures_match_recursive_walk(seed):
+    causal_model = build_random_model(60, 90, seed)
+    compiled = causal_model.compile()
+    for part in causal_model.parts:
+        ancestors = reference_closure(part, 'caused_by')
+        descendants = reference_closure(part, 'causes')
+        part_idx = compiled.get_index(part.part_id)
+        assert set(compiled.get_part_ids(compiled.ancestors(part_idx))) == ancestors
+        assert set(compiled.get_part_ids(compiled.descendants(part_idx))) == descendants
+        assert {cause.part_id for cause in causal_model.find_all_causes_for_part(part.part_id, [])} == ancestors
+        assert {failure.part_id for failure in causal_model.find_failures_caused_by_part(part.part_id, [])} == descendants
+
+
+def matrix_edges(causal_model):
+    return sorted((part.part_id, cause.part_id) for part in causal_model.parts for cause in part.causes)
+
+
+def test_init_from_dense_matrix():
+    matrix = np.zeros((4, 4))
+    matrix[0, 1] = matrix[1, 2] = matrix[2, 1] = 1
+    matrix[3, 3] = 0.5
+    causal_model = CausalModel()
+    causal_model.init_from_matrix(matrix, ['a', 'b', 'c', 'd'])
+    assert [part.part_id for part in causal_model.parts] == ['a', 'b', 'c', 'd']
+    assert matrix_edges(causal_model) == [('a', 'b'), ('b', 'c'), ('c', 'b'), ('d', 'd')]
+    assert {part.part_id for part in causal_model.find_all_causes_for_part('c', [])} == {'a', 'b', 'c'}
+
+
+def test_init_from_sparse_matrix_matches_dense():
+    sparse = pytest.importorskip('scipy.sparse')
+    rng = np.random.default_rng(0)
+    dense = (rng.random((30, 30)) < 0.1).astype(float)
+    matrix = sparse.csr_matrix(dense)
+    # explicit zeros are not edges
+    matrix.data[0] = 0
+    dense[tuple(np.argwhere(dense)[0])] = 0
+    from_sparse, from_dense = CausalModel(), CausalModel()
+    from_sparse.init_from_matrix(matrix)
+    from_dense.init_from_matrix(dense)
+    assert len(from_sparse.parts) == 30
+    assert matrix_edges(from_sparse) == matrix_edges(from_dense)
+
+
+def test_init_from_labelled_coo_edges():
+    causal_model = CausalModel()
+    causal_model.init_from_matrix((np.array([0, 0, 2, 0]), np.array([1, 2, 1, 1])), ['x', 'y', 'z', 'isolated'])
+    assert [part.part_id for part in causal_model.parts] == ['x', 'y', 'z', 'isolated']
+    assert matrix_edges(causal_model) == [('x', 'y'), ('x', 'z'), ('z', 'y')]
+    isolated = causal_model.get_part_from_id('isolated')
+    assert not isolated.causes and not isolated.caused_by
+
+
+@pytest.mark.parametrize('matrix, part_ids', [
+    ((np.array([0, 3]), np.array([1, 1])), ['a', 'b', 'c']),
+    ((np.array([0, -1]), np.array([1, 1])), None),
+    ((np.array([0, 1]), np.array([1])), None),
+    (np.eye(2), ['a', 'a']),
+    (np.eye(2), ['a', 'b', 'c']),
+    (np.ones((2, 3)), None),
+    (np.ones(3), None),
+])
+def test_malformed_matrices_raise_value_error(matrix, part_ids):
+    with pytest.raises(ValueError):
+        CompiledCausalModel.from_matrix(matrix, part_ids)
+    with pytest.raises(ValueError):
+        CausalModel().init_from_matrix(matrix, part_ids)
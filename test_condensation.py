@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from causal_algorithms import generate_plan_causal_condensed, generate_plan_causal_from_single_part
+from conftest import build_random_model, reference_closure
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_condensed_closures_match_recursive_walk(seed):
+    causal_model = build_random_model(60, 90, seed)
+    condensed = causal_model.condense()
+    compiled = condensed.compiled
+    for part in causal_model.parts:
+        part_idx = compiled.get_index(part.part_id)
+        assert set(compiled.get_part_ids(condensed.ancestors(part_idx))) == reference_closure(part, 'caused_by')
+        assert set(compiled.get_part_ids(condensed.descendants(part_idx))) == reference_closure(part, 'causes')
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_plan_lists_components_back_to_back(seed):
+    causal_model = build_random_model(40, 60, seed)
+    condensed = causal_model.condense()
+    rng = np.random.default_rng(seed)
+    for broken_idx in range(40):
+        plan = condensed.plan(broken_idx, rng)
+        assert plan[0] == broken_idx
+        assert np.array_equal(np.sort(plan), np.sort(condensed.compiled.ancestors(broken_idx)))
+        labels = condensed.labels[plan]
+        # every component appears as one run, the broken part's component first
+        runs = labels[np.r_[True, labels[1:] != labels[:-1]]]
+        assert len(runs) == len(set(runs.tolist()))
+        assert runs[0] == condensed.labels[broken_idx]
+
+
+def test_broken_component_comes_before_nearer_parts():
+    # 0 <- 1 <- 2 <- 3 -> 0 is a loop two hops deep, 4 causes 0 directly from outside the loop
+    matrix = np.zeros((5, 5), dtype=int)
+    for cause, failure in ((1, 0), (2, 1), (3, 2), (0, 3), (4, 0)):
+        matrix[cause, failure] = 1
+    plan = generate_plan_causal_condensed(matrix, 0)
+    assert plan == [0, 1, 2, 3, 4]
+    # the part by part BFS reaches 4 one hop away before the rest of the loop
+    bfs_plan = generate_plan_causal_from_single_part(matrix, 0)
+    assert bfs_plan.index(4) < bfs_plan.index(2)
@@ -0,0 +1,102 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from conftest import build_random_model
+from diagnosis_service import DiagnosisClient, DiagnosisService
+
+
+def build_service(**kwargs):
+    causal_model = build_random_model(60, 90, 0, num_observable=8, num_non_interactable=10)
+    causal_model.set_failure_rate_array(np.random.default_rng(0).random(50), causal_model.get_interactable_mask())
+    return causal_model, DiagnosisService(causal_model, **kwargs)
+
+
+def test_bad_limit_fails_only_its_own_request():
+    causal_model, service = build_service(window=0.05)
+    working, failing = causal_model.observable_parts[:2], causal_model.observable_parts[2:3]
+
+    async def run():
+        requests = [service.diagnose(working, failing) for _ in range(5)]
+        requests += [service.diagnose(working, failing, '3'), service.diagnose(working, failing, -1),
+                     service.diagnose(working, failing, True)]
+        return await asyncio.gather(*requests, return_exceptions=True)
+
+    results = asyncio.run(run())
+    expected = set(causal_model.find_potential_root_causes_from_observerables(working, failing))
+    for result in results[:5]:
+        assert {part_id for part_id, _ in result} == expected
+    for result in results[5:]:
+        assert isinstance(result, ValueError)
+
+
+def test_broken_report_does_not_fail_the_batch():
+    causal_model, service = build_service()
+    working, failing = service.compiled.get_indices(causal_model.observable_parts[:2]), np.empty(0, dtype=np.int64)
+    # an index outside the model can only come from a caller bypassing diagnose
+    results = service.evaluate_batch([(working, failing, None), (np.array([10 ** 6]), failing, None),
+                                      (working, failing, 3)])
+    assert isinstance(results[1], IndexError)
+    assert results[2] == results[0][:3]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_batches_match_the_graph_query(seed):
+    causal_model, service = build_service(window=0.01)
+    rng = np.random.default_rng(seed)
+    reports = []
+    for _ in range(100):
+        observed = rng.permutation(causal_model.observable_parts)[:rng.integers(0, 9)].tolist()
+        num_failing = int(rng.integers(0, len(observed) + 1))
+        reports.append((observed[num_failing:], observed[:num_failing]))
+    # a part reported both working and failing leaves no candidate
+    reports.append((causal_model.observable_parts[:1], causal_model.observable_parts[:2]))
+
+    async def run():
+        return await asyncio.gather(*(service.diagnose(working, failing) for working, failing in reports))
+
+    results = asyncio.run(run())
+    # the small model takes the dense path, check the per report path on the same reports
+    indexed_reports = [(service.compiled.get_indices(working), service.compiled.get_indices(failing), None)
+                       for working, failing in reports]
+    assert service.evaluate_batch(indexed_reports, dense=False) == results
+    for (working, failing), result in zip(reports, results):
+        assert {part_id for part_id, _ in result} == set(
+            causal_model.find_potential_root_causes_from_observerables(working, failing))
+        probabilities = [probability for _, probability in result]
+        assert probabilities == sorted(probabilities, reverse=True)
+        assert not result or np.isclose(sum(probabilities), 1.0)
+
+
+def test_socket_round_trip():
+    causal_model, service = build_service()
+    working, failing = causal_model.observable_parts[:2], causal_model.observable_parts[2:3]
+
+    async def run():
+        server = await service.start_server()
+        client = await DiagnosisClient.connect(port=server.sockets[0].getsockname()[1])
+        try:
+            results = await asyncio.gather(client.diagnose(working, failing, 2), client.diagnose(['missing'], []),
+                                           client.diagnose(working, failing, 'all'), return_exceptions=True)
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+        return results
+
+    candidates, unknown_part, bad_limit = asyncio.run(run())
+    assert len(candidates) == 2
+    assert isinstance(unknown_part, ValueError) and isinstance(bad_limit, ValueError)
+
+
+def test_dense_and_packed_paths_agree():
+    causal_model, service = build_service()
+    rng = np.random.default_rng(0)
+    observable_indices = service.compiled.observable_indices()
+    reports = []
+    for num_observed in (0, 2, 5, 8, 8):
+        observed = rng.permutation(observable_indices)[:num_observed]
+        reports.append((np.sort(observed[:num_observed // 2]), np.sort(observed[num_observed // 2:]), None))
+    reports.append((observable_indices[:1], observable_indices[:2], None))
+    assert service.evaluate_batch(reports, dense=True) == service.evaluate_batch(reports, dense=False)
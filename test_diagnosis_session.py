@@ -0,0 +1,75 @@
+import random
+
+import numpy as np
+import pytest
+
+from conftest import build_random_model, reference_root_causes
+from information_gain import CHECK_PART
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_candidates_follow_the_graph_query(seed):
+    causal_model = build_random_model(50, 70, seed, num_observable=8, num_non_interactable=8)
+    session = causal_model.start_diagnosis_session()
+    assert set(session.candidates()) == set(causal_model.get_interactable_part_ids())
+    rnd = random.Random(seed)
+    working, failing, observations = [], [], []
+    for part_id in rnd.sample(causal_model.observable_parts, 6):
+        is_working = rnd.random() < 0.5
+        session.observe(part_id, is_working)
+        observations.append((part_id, is_working))
+        (working if is_working else failing).append(part_id)
+        expected = reference_root_causes(causal_model, working, failing)
+        assert set(session.candidates()) == expected
+        assert set(causal_model.find_potential_root_causes_from_observerables(working, failing)) == expected
+        assert session.num_candidates() == len(expected)
+    assert session.history == observations
+
+
+def test_rule_out_undo_and_reset():
+    causal_model = build_random_model(30, 40, 1, num_observable=4)
+    session = causal_model.start_diagnosis_session()
+    failing = causal_model.observable_parts[0]
+    session.observe_failing(failing)
+    after_failing = session.candidates()
+    ruled_out = after_failing[0]
+    session.rule_out(ruled_out)
+    assert session.candidates() == [part_id for part_id in after_failing if part_id != ruled_out]
+
+    assert session.undo() == (ruled_out, None)
+    assert session.candidates() == after_failing
+    assert session.undo() == (failing, False)
+    assert set(session.candidates()) == set(causal_model.get_interactable_part_ids())
+    with pytest.raises(ValueError):
+        session.undo()
+
+    session.observe_working(failing)
+    session.reset()
+    assert session.history == [] and session.num_candidates() == len(causal_model.get_interactable_part_ids())
+
+
+def test_candidate_probabilities():
+    causal_model = build_random_model(30, 40, 2, num_observable=4, num_non_interactable=5)
+    session = causal_model.start_diagnosis_session()
+    session.observe_failing(causal_model.observable_parts[0])
+    candidates = session.candidates()
+    # no rates set yet
+    assert session.candidate_probabilities() == pytest.approx({part_id: 1 / len(candidates) for part_id in candidates})
+
+    rates = np.random.default_rng(2).random(len(candidates))
+    causal_model.set_part_failure_rates(candidates, rates.tolist())
+    probabilities = session.candidate_probabilities()
+    assert probabilities == pytest.approx(dict(zip(candidates, (rates / rates.sum()).tolist())))
+    ranked = session.ranked_candidates()
+    assert [probability for _, probability in ranked] == sorted(probabilities.values(), reverse=True)
+
+
+def test_next_check_uses_the_current_failure_rates():
+    causal_model = build_random_model(12, 16, 0, num_observable=3)
+    session = causal_model.start_diagnosis_session()
+    assert session.next_check() is not None
+    part_ids = causal_model.get_interactable_part_ids()
+    causal_model.set_part_failure_rates(part_ids, [0.0] * (len(part_ids) - 1) + [1.0])
+    # only the last part can be the root cause now, the planner built by the first call must see that
+    assert session.next_check() == (CHECK_PART, part_ids[-1])
+    assert session.ranked_candidates()[0] == (part_ids[-1], 1.0)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from causal_graph_structure import CausalModel
+from conftest import random_case, reference_permutation_average
+from expected_instructions import compute_expected_values, compute_expected_values_batch
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_closed_form_matches_permutation_loop(seed):
+    reference_model, causal_model, distribution = random_case(seed)
+    expected = reference_permutation_average(reference_model, distribution)
+
+    assert np.allclose(compute_expected_values(causal_model, distribution), expected)
+    means, half_widths = compute_expected_values(causal_model, distribution, method='monte_carlo', num_samples=20000,
+                                                 rng=np.random.default_rng(seed))
+    assert np.all(np.abs(means - expected) <= 2 * half_widths + 1e-12)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_batch_matches_single_distributions(seed):
+    _, causal_model, distribution = random_case(seed)
+    distributions = [distribution, distribution[::-1], sorted(distribution)]
+    # three arrays (E[M_f], E[M_c], E[M_cf]) with one entry per distribution
+    batch = np.array(compute_expected_values_batch(causal_model, distributions))
+    for row, single in enumerate(distributions):
+        assert np.allclose(batch[:, row], compute_expected_values(causal_model, single))
+
+
+def test_example_circuits_match_permutation_loop():
+    from instruction_efficiency import build_circuit_1, build_circuit_2, create_distrobution_truncated_geometric
+
+    distribution = create_distrobution_truncated_geometric(6, 0.75)
+    for build_circuit in (build_circuit_1, build_circuit_2):
+        expected = reference_permutation_average(build_circuit(), distribution)
+        assert np.allclose(compute_expected_values(build_circuit(), distribution), expected)
+
+
+def test_single_interactable_part():
+    causal_model = CausalModel()
+    causal_model.add_part_full('a', [], ['b'])
+    causal_model.set_observable_parts(['b'])
+    causal_model.set_non_interactable_parts(['b'])
+    assert np.allclose(compute_expected_values(causal_model, [1.0]), (1.0, 1.0, 1.0))
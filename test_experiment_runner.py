@@ -0,0 +1,60 @@
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+from conftest import build_random_model, random_case, reference_permutation_average
+from experiment_runner import run_experiments, unrank_permutations
+
+
+def test_unrank_permutations_follows_itertools_order():
+    permutations = unrank_permutations(np.arange(math.factorial(5)), 5)
+    assert permutations.tolist() == [list(permutation) for permutation in itertools.permutations(range(5))]
+
+
+def test_run_experiments_matches_permutation_loop():
+    reference_models = {}
+    models = {}
+    for seed in range(2):
+        reference_models[seed], models[seed], _ = random_case(seed, num_parts=7, num_non_interactable=2)
+    distributions = {'geometric': [0.5, 0.25, 0.125, 0.0625, 0.0625], 'step': [0.5, 0.5, 0.0, 0.0, 0.0]}
+
+    results = run_experiments(models, distributions, max_workers=2, chunk_size=7)
+    sampled = run_experiments(models, distributions, max_workers=2, num_samples=4000, seed=1)
+    for seed, reference_model in reference_models.items():
+        for name, distribution in distributions.items():
+            expected = reference_permutation_average(reference_model, distribution)
+            assert np.allclose(results[seed, name], expected)
+            assert np.allclose(sampled[seed, name], expected, rtol=0.05)
+
+
+def test_unrank_permutations_rejects_ranks_beyond_int64():
+    assert unrank_permutations([math.factorial(20) - 1], 20)[0].tolist() == list(range(19, -1, -1))
+    with pytest.raises(ValueError):
+        unrank_permutations([0], 21)
+
+
+def test_large_models_are_sampled_above_the_permutation_cap():
+    # 30 interactable parts, enumerating 30! permutations would never finish
+    causal_model = build_random_model(36, 50, 0, num_observable=4, num_non_interactable=6)
+    distribution = np.random.default_rng(0).random(30)
+    distributions = {'random': (distribution / distribution.sum()).tolist()}
+
+    results = run_experiments({'large': causal_model}, distributions, max_workers=2, chunk_size=64,
+                              max_permutations=500, seed=3)
+    assert results == run_experiments({'large': causal_model}, distributions, max_workers=1, chunk_size=64,
+                                      max_permutations=500, seed=3)
+    expected = run_experiments({'large': causal_model}, distributions, max_workers=2, num_samples=4000, seed=4)
+    assert np.allclose(results['large', 'random'], expected['large', 'random'], rtol=0.05)
+
+
+def test_small_pairs_are_enumerated_below_the_cap():
+    reference_model, causal_model, _ = random_case(1, num_parts=7, num_non_interactable=2)
+    distributions = {'geometric': [0.5, 0.25, 0.125, 0.0625, 0.0625]}
+    expected = reference_permutation_average(reference_model, distributions['geometric'])
+    # 5! = 120 permutations, enumerated at the cap and sampled just below it
+    assert np.allclose(run_experiments({1: causal_model}, distributions, max_workers=1,
+                                       max_permutations=120)[1, 'geometric'], expected)
+    sampled = run_experiments({1: causal_model}, distributions, max_workers=1, max_permutations=119)[1, 'geometric']
+    assert not np.allclose(sampled, expected, rtol=1e-12, atol=0)
@@ -0,0 +1,16 @@
+import pytest
+
+from conftest import build_random_model, reference_root_causes
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_fault_signatures_match_graph_queries(seed):
+    causal_model = build_random_model(50, 70, seed, num_observable=7, num_non_interactable=8)
+    expected = {part.part_id: causal_model.find_observables_from_failure(part.part_id)
+                for part in causal_model.parts}
+    signatures = causal_model.get_fault_signature_table()
+    for part in causal_model.parts:
+        assert causal_model.find_observables_from_failure(part.part_id) == expected[part.part_id]
+        working, failing = expected[part.part_id]
+        blanket = signatures.compiled.get_part_ids(signatures.blanket(signatures.compiled.get_index(part.part_id)))
+        assert set(blanket) == reference_root_causes(causal_model, working, failing)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from conftest import build_random_model
+from expected_instructions import compute_expected_values
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_free_observations_reproduce_combined_strategy(seed):
+    causal_model = build_random_model(9, 12, seed, num_observable=3, num_non_interactable=4)
+    num_interactable = len(causal_model.get_interactable_part_ids())
+    distribution = np.random.default_rng(seed).random(num_interactable)
+    distribution /= distribution.sum()
+
+    expected_value, half_width = causal_model.get_information_gain_planner(0.0).average_expected_instructions(
+        distribution, num_samples=None)
+    assert half_width == 0.0
+    assert np.isclose(expected_value, compute_expected_values(causal_model, distribution)[2])
+
+
+def test_sampling_above_the_permutation_cap():
+    causal_model = build_random_model(9, 12, 0, num_observable=3, num_non_interactable=4)
+    planner = causal_model.get_information_gain_planner()
+    distribution = np.array([0.4, 0.3, 0.15, 0.1, 0.05])
+
+    exact, exact_half_width = planner.average_expected_instructions(distribution)
+    assert exact_half_width == 0.0
+    mean, half_width = planner.average_expected_instructions(distribution, num_samples=400,
+                                                             rng=np.random.default_rng(0), max_permutations=0)
+    assert 0.0 < half_width < 0.5
+    assert abs(mean - exact) <= 2 * half_width
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from conftest import random_case, reference_causal, reference_combined, reference_frequency
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_dataframe_evaluators_match_iterrows_loop(seed):
+    pd = pytest.importorskip('pandas')
+    from instruction_efficiency import (compute_expected_value_causal, compute_expected_value_combined,
+                                        compute_expected_value_frequency)
+
+    reference_model, causal_model, _ = random_case(seed, num_parts=40, num_edges=50, num_observable=6,
+                                                   num_non_interactable=10)
+    part_ids = causal_model.get_interactable_part_ids()
+    rates = np.random.default_rng(seed).random(len(part_ids))
+    if seed % 4 == 0:
+        rates[:len(rates) // 2] = 0
+    rates = (rates / rates.sum()).tolist()
+    for model in (reference_model, causal_model):
+        model.set_part_failure_rates(part_ids, rates)
+    part_frequencies_df = pd.DataFrame({'part ids': part_ids, 'failure rates': rates}).sort_values(by=['failure rates'])
+    df_ids = part_frequencies_df['part ids'].tolist()
+    df_rates = part_frequencies_df['failure rates'].tolist()
+
+    assert np.isclose(compute_expected_value_frequency(list(df_rates)), reference_frequency(df_rates))
+    assert np.isclose(compute_expected_value_causal(causal_model, part_frequencies_df),
+                      reference_causal(reference_model, df_ids, df_rates))
+    assert np.isclose(compute_expected_value_combined(causal_model, part_frequencies_df),
+                      reference_combined(reference_model, df_ids, df_rates))
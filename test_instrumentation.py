@@ -0,0 +1,52 @@
+import pytest
+
+import instrumentation
+from conftest import build_random_model
+
+
+def test_visited_nodes_come_from_the_walks_and_cache_hits_are_counted_apart():
+    causal_model = build_random_model(30, 40, 0, num_observable=4)
+    causal_model.set_query_cache_size(16)
+    num_causes = len(causal_model.find_all_causes_for_part('p0', []))
+    causal_model.set_query_cache_size(16)
+
+    with instrumentation.profile() as profiler:
+        causal_model.find_all_causes_for_part('p0', [])
+    stats = profiler.stats['CausalModel.find_all_causes_for_part']
+    assert (stats['calls'], stats['visited_nodes'], stats['cache_hits']) == (1, num_causes, 0)
+
+    with instrumentation.profile() as profiler:
+        causal_model.find_all_causes_for_part('p0', [])
+    stats = profiler.stats['CausalModel.find_all_causes_for_part']
+    assert (stats['calls'], stats['visited_nodes'], stats['cache_hits']) == (1, 0, 1)
+
+
+def test_nested_calls_are_inclusive():
+    causal_model = build_random_model(30, 40, 1, num_observable=4)
+    failing = causal_model.observable_parts[:2]
+    walked = sum(len(causal_model.find_all_causes_for_part(part_id, [])) for part_id in failing)
+    causal_model.set_query_cache_size(0)
+
+    with instrumentation.profile() as profiler:
+        causal_model.find_potential_root_causes_from_observerables([], failing)
+    query = profiler.stats['CausalModel.find_potential_root_causes_from_observerables']
+    closures = profiler.stats['CausalModel.find_all_causes_for_part']
+    assert closures['calls'] == 2
+    assert query['visited_nodes'] == closures['visited_nodes'] == walked
+
+
+def test_disabled_and_failing_calls():
+    causal_model = build_random_model(10, 10, 2)
+    instrumentation.reset()
+    causal_model.find_all_causes_for_part('p1', [])
+    assert instrumentation.snapshot() == {}
+
+    with instrumentation.profile() as profiler:
+        with pytest.raises(AttributeError):
+            causal_model.find_all_causes_for_part('missing', [])
+        causal_model.find_failures_caused_by_part('p1', [])
+    # the failed call is recorded and does not leak its counters into the next one
+    assert profiler.stats['CausalModel.find_all_causes_for_part']['calls'] == 1
+    assert profiler.stats['CausalModel.find_failures_caused_by_part']['visited_nodes'] == len(
+        causal_model.find_failures_caused_by_part('p1', []))
+    assert not instrumentation.is_enabled()
@@ -0,0 +1,46 @@
+import numpy as np
+
+from array_causal_model import ArrayCausalModel
+from causal_graph_structure import CausalModel
+from model_file import load_compiled_model
+
+
+def build_model():
+    causal_model = CausalModel()
+    causal_model.add_part_full('a', [], ['x'])
+    causal_model.add_part_full('b', [], ['y'])
+    causal_model.add_part_full('x', [], [])
+    causal_model.add_part_full('y', [], [])
+    # not in index order, the order labels the columns of observation matrices
+    causal_model.set_observable_parts(['y', 'x'])
+    causal_model.set_non_interactable_parts(['x', 'y'])
+    causal_model.set_part_failure_rates(['a', 'b'], [0.25, 0.75])
+    return causal_model
+
+
+def test_save_load_round_trip(tmp_path):
+    causal_model = build_model()
+    causal_model.save(tmp_path / 'model.bin')
+    loaded = CausalModel.load(tmp_path / 'model.bin')
+
+    assert [part.part_id for part in loaded.parts] == [part.part_id for part in causal_model.parts]
+    assert loaded.observable_parts == ['y', 'x']
+    assert loaded.non_interactable_parts == ['x', 'y']
+    assert loaded.get_part_failure_rates(['a', 'b']) == [0.25, 0.75]
+    for part in causal_model.parts:
+        assert ([cause.part_id for cause in loaded.get_part_from_id(part.part_id).causes] ==
+                [cause.part_id for cause in part.causes])
+
+
+def test_observation_columns_keep_their_order(tmp_path):
+    causal_model = build_model()
+    observations = np.array([[0, 1]])
+    expected = causal_model.find_potential_root_causes_batch(observations)
+    assert np.flatnonzero(expected[0]).tolist() == [0]
+
+    causal_model.save(tmp_path / 'model.bin')
+    assert np.array_equal(CausalModel.load(tmp_path / 'model.bin').find_potential_root_causes_batch(observations),
+                          expected)
+    assert np.array_equal(ArrayCausalModel(causal_model.compile()).find_potential_root_causes_batch(observations),
+                          expected)
+    assert load_compiled_model(tmp_path / 'model.bin').observable_indices().tolist() == [3, 1]
@@ -0,0 +1,76 @@
+from conftest import build_random_model
+from query_cache import QueryCache
+
+
+def cached_model(maxsize=64, **kwargs):
+    causal_model = build_random_model(30, 40, 0, num_observable=5, num_non_interactable=4)
+    causal_model.set_query_cache_size(maxsize, **kwargs)
+    return causal_model
+
+
+def test_iterator_arguments_are_read_once():
+    causal_model = cached_model()
+    working, failing = causal_model.observable_parts[:2], causal_model.observable_parts[2:4]
+    expected = causal_model.find_potential_root_causes_from_observerables(working, failing)
+    causal_model.set_query_cache_size(64)
+    assert causal_model.find_potential_root_causes_from_observerables(iter(working), iter(failing)) == expected
+    assert causal_model.find_potential_root_causes_from_observerables(working, failing) == expected
+    assert causal_model.query_cache_info()['hits'] == 1
+
+
+def test_hits_and_misses():
+    causal_model = cached_model()
+    first = causal_model.find_all_causes_for_part('p0', [])
+    assert causal_model.find_all_causes_for_part('p0', []) == first
+    causal_model.find_observables_from_failure('p0')
+    causal_model.find_observables_from_failure('p0')
+    info = causal_model.query_cache_info()
+    # the observables query also caches the descendant closure it walks
+    assert (info['hits'], info['misses'], info['size']) == (2, 3, 3)
+    # a caller's non empty list bypasses the cache
+    causal_model.find_all_causes_for_part('p0', [first[0]])
+    assert causal_model.query_cache_info()['misses'] == 3
+
+
+def test_structural_changes_invalidate():
+    changes = [lambda causal_model: causal_model.add_part_full('p0', [], ['p1']),
+               lambda causal_model: causal_model.add_part_full('new', ['p0'], []),
+               lambda causal_model: causal_model.set_observable_parts(['p1', 'p2']),
+               lambda causal_model: causal_model.set_non_interactable_parts(['p3'])]
+    for change in changes:
+        causal_model = cached_model()
+        causal_model.find_failures_caused_by_part('p0', [])
+        version = causal_model.query_cache_info()['version']
+        change(causal_model)
+        causal_model.find_failures_caused_by_part('p0', [])
+        info = causal_model.query_cache_info()
+        assert (info['hits'], info['misses'], info['size']) == (0, 2, 1)
+        assert info['version'] != version
+
+
+def test_failure_rate_changes_keep_the_cache():
+    causal_model = cached_model()
+    part_ids = causal_model.get_interactable_part_ids()
+    causal_model.find_observables_from_failure('p0')
+    causal_model.set_part_failure_rates(part_ids, [1 / len(part_ids)] * len(part_ids))
+    causal_model.set_failure_rate_array(causal_model.get_failure_rate_array() * 2)
+    causal_model.find_observables_from_failure('p0')
+    assert causal_model.query_cache_info()['hits'] == 1
+
+
+def test_total_elements_are_bounded():
+    causal_model = cached_model(maxsize=1000, max_elements=60)
+    closures = {part.part_id: len(causal_model.find_all_causes_for_part(part.part_id, []))
+                for part in causal_model.parts}
+    info = causal_model.query_cache_info()
+    assert info['elements'] <= 60
+    assert info['size'] < len(closures)
+
+    cache = QueryCache(maxsize=10, max_elements=5)
+    assert cache.get(0, 'large', lambda: tuple(range(6))) == tuple(range(6))
+    cache.get(0, 'a', lambda: (1, 2, 3))
+    cache.get(0, 'b', lambda: (4, 5))
+    cache.get(0, 'a', lambda: ())
+    cache.get(0, 'c', lambda: (6,))
+    # 'b' was the least recently used entry
+    assert list(cache.entries) == ['a', 'c'] and cache.num_elements == 4
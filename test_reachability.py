@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+import pytest
+
+from conftest import build_random_model, random_reports, reference_closure, reference_root_causes
+from reachability import OBSERVATION_FAILING, OBSERVATION_UNKNOWN, OBSERVATION_WORKING
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_index_closures_match_recursive_walk(seed):
+    causal_model = build_random_model(60, 90, seed)
+    compiled = causal_model.compile()
+    index = causal_model.build_reachability_index()
+    for part in causal_model.parts:
+        ancestors = reference_closure(part, 'caused_by')
+        descendants = reference_closure(part, 'causes')
+        part_idx = compiled.get_index(part.part_id)
+        assert set(compiled.get_part_ids(index.ancestors(part_idx))) == ancestors
+        assert set(compiled.get_part_ids(index.descendants(part_idx))) == descendants
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_root_cause_queries_match_recursive_walk(seed):
+    causal_model = build_random_model(60, 90, seed, num_observable=8, num_non_interactable=10)
+    reports = random_reports(causal_model, 40, seed)
+    expected = [reference_root_causes(causal_model, working, failing) for working, failing in reports]
+    for (working, failing), candidates in zip(reports, expected):
+        assert set(causal_model.find_potential_root_causes_from_observerables(working, failing)) == candidates
+
+    causal_model.build_reachability_index()
+    for (working, failing), candidates in zip(reports, expected):
+        assert set(causal_model.find_potential_root_causes_from_observerables(working, failing)) == candidates
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_batch_query_matches_recursive_walk(seed):
+    causal_model = build_random_model(60, 90, seed, num_observable=8, num_non_interactable=10)
+    reports = random_reports(causal_model, 40, seed)
+    expected = [reference_root_causes(causal_model, working, failing) for working, failing in reports]
+    observations = np.full((len(reports), len(causal_model.observable_parts)), OBSERVATION_UNKNOWN)
+    column_of = {part_id: column for column, part_id in enumerate(causal_model.observable_parts)}
+    for row, (working, failing) in enumerate(reports):
+        observations[row, [column_of[part_id] for part_id in working]] = OBSERVATION_WORKING
+        observations[row, [column_of[part_id] for part_id in failing]] = OBSERVATION_FAILING
+    matrix = causal_model.find_potential_root_causes_batch(observations)
+    part_ids = [part.part_id for part in causal_model.parts]
+    for row, candidates in enumerate(expected):
+        assert {part_ids[idx] for idx in np.flatnonzero(matrix[row])} == candidates
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_patched_index_matches_rebuilt_index(seed):
+    rnd = random.Random(seed)
+    causal_model = build_random_model(40, 40, seed, num_observable=6)
+    causal_model.build_reachability_index()
+    for _ in range(20):
+        causal_model.add_part_full('p%d' % rnd.randrange(40), [], ['p%d' % rnd.randrange(40)])
+    causal_model.set_non_interactable_parts(rnd.sample([part.part_id for part in causal_model.parts], 5))
+    for working, failing in random_reports(causal_model, 30, seed):
+        assert (set(causal_model.find_potential_root_causes_from_observerables(working, failing)) ==
+                reference_root_causes(causal_model, working, failing))